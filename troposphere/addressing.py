@@ -0,0 +1,128 @@
+import bisect
+import json
+
+import cache
+
+# Address planning for the environments. VPC ranges are allocated from a list of supernets, and
+# subnet ranges from the range of their VPC, always taking the first free block of the right size.
+# Allocations are kept in a table that is persisted between runs, so a VPC or a subnet never
+# moves once it has been allocated, no matter the order of the environments or the zones.
+
+
+def parse_cidr(cidr):
+    address, prefix = cidr.split("/")
+    octets = [int(octet) for octet in address.split(".")]
+    return octets[0] << 24 | octets[1] << 16 | octets[2] << 8 | octets[3], int(prefix)
+
+
+def format_cidr(address, prefix):
+    return "%d.%d.%d.%d/%d" % (address >> 24 & 255, address >> 16 & 255, address >> 8 & 255, address & 255, prefix)
+
+
+def cidr_range(cidr):
+    address, prefix = parse_cidr(cidr)
+    return address, address + 2 ** (32 - prefix)
+
+
+class AddressPlanner(object):
+
+    def __init__(self, allocations=None):
+        # Intervals [start, end) sorted by start, and the furthest end of every prefix of that list,
+        # so overlaps are found with a binary search even when reserved ranges nest
+        self._intervals = []
+        self._furthest = []
+        self.allocations = {}
+        for name, cidr in sorted((allocations or {}).items()):
+            self.reserve(name, cidr)
+            self.allocations[name] = cidr
+
+    def overlap(self, start, end):
+        # Returns the furthest end of the intervals overlapping [start, end), or None
+        index = bisect.bisect_left(self._intervals, (end,))
+        if index and self._furthest[index - 1] > start:
+            return self._furthest[index - 1]
+        return None
+
+    def reserve(self, name, cidr):
+        start, end = cidr_range(cidr)
+        index = bisect.bisect_left(self._intervals, (start, end, name))
+        self._intervals.insert(index, (start, end, name))
+        self._furthest.insert(index, 0)
+        for i in range(index, len(self._intervals)):
+            self._furthest[i] = max(self._furthest[i - 1] if i else 0, self._intervals[i][1])
+
+    def conflicts(self, cidr):
+        start, end = cidr_range(cidr)
+        return [name for first, last, name in self._intervals if first < end and last > start]
+
+    def allocate(self, name, supernets, prefix):
+        if name in self.allocations:
+            return self.allocations[name]
+
+        size = 2 ** (32 - prefix)
+        for supernet in supernets:
+            start, end = cidr_range(supernet)
+            # Blocks must be aligned to their own size
+            address = (start + size - 1) // size * size
+            while address + size <= end:
+                furthest = self.overlap(address, address + size)
+                if furthest is None:
+                    cidr = format_cidr(address, prefix)
+                    self.reserve(name, cidr)
+                    self.allocations[name] = cidr
+                    return cidr
+                address = (furthest + size - 1) // size * size
+
+        raise ValueError("No free /%d left in %s for %s" % (prefix, ", ".join(supernets), name))
+
+
+def load_table(path):
+    table = cache.load_state(path)
+    table.setdefault("environments", {})
+    return table
+
+
+def save_table(path, table):
+    cache.write(path, json.dumps(table, indent=4, sort_keys=True).encode("utf-8"))
+
+
+def subnet_prefixes(vpc_prefix, availability_zones, tiers):
+    # Tiers without an explicit prefix take 1/2^bits of an even share of the VPC range per zone
+    zone_prefix = vpc_prefix + (len(availability_zones) - 1).bit_length()
+    return dict(
+        (tier["name"], tier["prefix"] if "prefix" in tier else zone_prefix + tier["bits"])
+        for tier in tiers
+    )
+
+
+def plan_environment(allocations, vpc_cidr, availability_zones, tiers):
+    vpc_address, vpc_prefix = parse_cidr(vpc_cidr)
+    prefixes = subnet_prefixes(vpc_prefix, availability_zones, tiers)
+    planner = AddressPlanner(dict((name, cidr) for name, cidr in allocations.items() if name != "VPC"))
+
+    # Subnets are allocated zone by zone, so every zone gets a contiguous block by default
+    for index in range(len(availability_zones)):
+        for tier in tiers:
+            planner.allocate("%sSubnet%d" % (tier["name"], index + 1), [vpc_cidr], prefixes[tier["name"]])
+
+    addresses = dict(planner.allocations, VPC=vpc_cidr)
+    allocations.update(addresses)
+    return addresses
+
+
+def plan_environments(table, environments, supernets, vpc_prefix, reserved, availability_zones, tiers):
+    allocations = table["environments"]
+    planner = AddressPlanner(dict(
+        (name, addresses["VPC"]) for name, addresses in allocations.items() if "VPC" in addresses
+    ))
+    for cidr in reserved:
+        conflicts = planner.conflicts(cidr)
+        if conflicts:
+            raise ValueError("Reserved range %s overlaps %s" % (cidr, ", ".join(conflicts)))
+        planner.reserve("reserved", cidr)
+
+    plans = {}
+    for name in environments:
+        vpc_cidr = planner.allocate(name, supernets, vpc_prefix)
+        plans[name] = plan_environment(allocations.setdefault(name, {}), vpc_cidr, availability_zones, tiers)
+    return plans
@@ -1,240 +1,853 @@
-from troposphere import Join, Parameter, Output
+import json
+from troposphere import GetAtt, Join, Parameter, Output, Sub
 from troposphere import Ref, Tags, Template
+from troposphere import ec2
+from troposphere.cloudwatch import Alarm, Dashboard, MetricDataQuery, MetricStat
+from troposphere.cloudwatch import Metric, MetricDimension
 from troposphere.ec2 import SecurityGroup, SecurityGroupIngress
-from troposphere.ecr import Repository
+from troposphere.ecr import LifecyclePolicy, Repository
+from troposphere.elasticache import ParameterGroup, ReplicationGroup
+from troposphere.rds import DBCluster, DBInstance, DBParameterGroup
+from troposphere.secretsmanager import GenerateSecretString, Secret, SecretTargetAttachment
+from troposphere.validators import integer
 from troposphere.iam import InstanceProfile
 from troposphere.iam import PolicyType
 from troposphere.iam import Role
+from troposphere.logs import MetricFilter, MetricTransformation
 
-t = Template()
-
-t.add_version("2010-09-09")
-t.add_description("Stack that creates resources needed for a specific application")
-
-vpcId = t.add_parameter(Parameter(
-    "VPC",
-    Type="String",
-    Description="VPC ID",
-))
-environment = t.add_parameter(Parameter(
-    "Environment",
-    Type="String",
-    Description="Environment where this is deployed",
-))
-appName = t.add_parameter(Parameter(
-    "AppName",
-    Type="String",
-    Description="Name of the application",
-))
-appPort = t.add_parameter(Parameter(
-    "AppPort",
-    Type="String",
-    Description="Port where the application will be listening",
-))
-appProtocol = t.add_parameter(Parameter(
-    "AppProtocol",
-    Type="String",
-    Description="Protocol used by the application",
-))
-exposedPort = t.add_parameter(Parameter(
-    "ExposedPort",
-    Type="String",
-    Description="Port where the load balancer will be listening",
-))
-MasterKey = t.add_parameter(Parameter(
-    "MasterKey",
-    Type="String",
-    Description="KMS key used",
-))
-StorageBucketName = t.add_parameter(Parameter(
-    "StorageBucketName",
-    Type="String",
-    Description="S3 Bucket for application data storage",
-))
-
-
-LoadBalancerSecurityGroup = t.add_resource(SecurityGroup(
-    "LoadBalancerSecurityGroup",
-    SecurityGroupIngress=[
-        {
-            "ToPort": Ref(exposedPort),
-            "FromPort": Ref(exposedPort),
-            "IpProtocol": "tcp",
-            "CidrIp": "0.0.0.0/0"
-        }
-    ],
-    VpcId=Ref(vpcId),
-    GroupDescription=Join("-", [Ref(environment), Ref(appName), "elb"]),
-    Tags=Tags(
-        Name=Join("-", [Ref(environment), Ref(appName), "elb"]),
-    ),
-))
-
-InstanceSecurityGroup = t.add_resource(SecurityGroup(
-    "InstanceSecurityGroup",
-    VpcId=Ref(vpcId),
-    GroupDescription=Join("-", [Ref(environment), Ref(appName), "instances"]),
-    Tags=Tags(
-        Name=Join("-", [Ref(environment), Ref(appName), "instances"]),
-    ),
-))
-
-IngressForELB = t.add_resource(SecurityGroupIngress(
-    "IngressForELB",
-    IpProtocol=Ref(appProtocol),
-    FromPort=Ref(appPort),
-    ToPort=Ref(appPort),
-    SourceSecurityGroupId=Ref("LoadBalancerSecurityGroup"),
-    GroupId=Ref("InstanceSecurityGroup")
-))
-IngressForInstances = t.add_resource(SecurityGroupIngress(
-    "IngressForInstances",
-    IpProtocol=Ref(appProtocol),
-    FromPort=Ref(appPort),
-    ToPort=Ref(appPort),
-    SourceSecurityGroupId=Ref("InstanceSecurityGroup"),
-    GroupId=Ref("InstanceSecurityGroup")
-))
-IngressForSSH = t.add_resource(SecurityGroupIngress(
-    "IngressForSSH",
-    IpProtocol="tcp",
-    FromPort=22,
-    ToPort=22,
-    CidrIp="0.0.0.0/0",
-    GroupId=Ref("InstanceSecurityGroup")
-))
-
-DBSecurityGroup = t.add_resource(SecurityGroup(
-    "DBSecurityGroup",
-    SecurityGroupIngress=[
-        {
-            "SourceSecurityGroupId": Ref("InstanceSecurityGroup"),
-            "FromPort": 0,
-            "ToPort": 65535,
-            "IpProtocol": "tcp"
-        }
-    ],
-    VpcId=Ref(vpcId),
-    GroupDescription=Join("-", [Ref(environment), Ref(appName), "db"]),
-    Tags=Tags(
-        Name=Join("-", [Ref(environment), Ref(appName), "db"]),
-    ),
-))
-
-# Profile for application instances
-IAMInstanceProfile = t.add_resource(InstanceProfile(
-    "IAMInstanceProfile",
-    Path=Join("", ["/", Ref(environment), "/", Ref(appName), "/"]),
-    Roles=[Ref("IAMRole")],
-))
-
-# Role for application instances
-IAMRole = t.add_resource(Role(
-    "IAMRole",
-    Path=Join("", ["/", Ref(environment), "/", Ref(appName), "/"]),
-    ManagedPolicyArns=[
-        "arn:aws:iam::aws:policy/service-role/AmazonEC2RoleforSSM",
-        "arn:aws:iam::aws:policy/AWSXrayFullAccess",
-        "arn:aws:iam::aws:policy/AmazonEC2ContainerRegistryReadOnly"
-    ],
-    AssumeRolePolicyDocument={
-        "Statement": [
-            {
-                "Action": ["sts:AssumeRole"],
-                "Effect": "Allow",
-                "Principal": {"Service": "ec2.amazonaws.com"}
-            }
-        ]
+from environment import AVAILABILITY_ZONES, zone_name
+
+# Optional Redis replication group of the application, in the ElastiCache subnet group of its environment
+#  - engine: only redis
+#  - engine_version: by default 6.x
+#  - family: family of the parameter group, it must match engine_version. By default redis6.x
+#  - node_type: by default cache.t3.micro
+#  - shards: number of node groups, more than one enables cluster mode. By default 1
+#  - replicas: read replicas of every shard, spread over the availability zones. By default 1
+#  - profile: tuning profile of the parameter group, see CACHE_PROFILES. By default "default"
+CACHE_DEFAULTS = {
+    "engine": "redis",
+    "engine_version": "6.x",
+    "family": "redis6.x",
+    "node_type": "cache.t3.micro",
+    "shards": 1,
+    "replicas": 1,
+    "profile": "default",
+}
+
+# Parameters set in the parameter group of the cache for every profile
+#  - default: the defaults of the engine
+#  - read-through: evicts the least recently used keys instead of failing writes once memory is full
+#  - low-latency: like read-through, and frees memory in the background instead of blocking the server
+CACHE_PROFILES = {
+    "default": {},
+    "read-through": {
+        "maxmemory-policy": "allkeys-lru",
     },
-))
-
-# Policy for instances so they can access the KMS key, CloudWatch LogGroup, S3 bucket, describe stack resources and describe ELB instances
-IAMPolicy = t.add_resource(PolicyType(
-    "IAMPolicy",
-    PolicyName=Join("-", [Ref("AWS::StackName"), "policy"]),
-    Roles=[Ref(IAMRole)],
-    PolicyDocument={
-        "Version": "2012-10-17",
-        "Statement": [{
-            "Action": ["s3:*"],
-            "Resource": Join("", ["arn:aws:s3:::", Ref(StorageBucketName), "/", Ref(environment), "/", Ref(appName), "/"]),
-            "Effect": "Allow",
-            "Sid": "allowScopedS3AccessRoot"
-        }, {
-            "Action": ["s3:*"],
-            "Resource": Join("", ["arn:aws:s3:::", Ref(StorageBucketName), "/", Ref(environment), "/", Ref(appName), "/*"]),
-            "Effect": "Allow",
-            "Sid": "allowScopedS3Access"
-        }, {
-            "Action": [
-                "kms:Encrypt",
-                "kms:Decrypt",
-                "kms:ReEncrypt",
-                "kms:GenerateDataKey*",
-                "kms:DescribeKey"
-            ],
-            "Resource": Join("/", [Join(":", ["arn:aws:kms", Ref("AWS::Region"), Ref("AWS::AccountId"), "key"]), Ref("MasterKey")]),
-            "Effect": "Allow",
-            "Sid": "allowKMSUse"
-        }, {
-            "Action": [
-                "elasticloadbalancing:DescribeInstanceHealth",
-            ],
-            "Resource": "*",
-            "Effect": "Allow",
-            "Sid": "allowDescribeELBInstances"
-        },  {
-            "Action": [
-                "cloudformation:DescribeStackResources",
-            ],
-            "Resource": "*",
-            "Effect": "Allow",
-            "Sid": "allowDescribeStackResources"
-        },  {
-            "Action": [
-                "ec2:DescribeInstances",
-            ],
-            "Resource": "*",
-            "Effect": "Allow",
-            "Sid": "allowDescribeEC2Instances"
+    "low-latency": {
+        "maxmemory-policy": "allkeys-lru",
+        "activedefrag": "yes",
+        "lazyfree-lazy-eviction": "yes",
+        "lazyfree-lazy-expire": "yes",
+        "lazyfree-lazy-server-del": "yes",
+    },
+}
+
+# Optional database of the application, in the RDS subnet group of its environment
+#  - engine: aurora-postgresql, aurora-mysql, postgres or mysql. By default aurora-postgresql
+#  - engine_version and family: version of the engine and family of its parameter group, see DATABASE_ENGINES
+#  - instance_class: class of the writer and of every replica. By default db.t3.medium
+#  - replicas: number of read replicas. By default 1
+#  - storage: GB allocated to postgres and mysql instances, Aurora grows its storage on its own. By default 20
+#  - profile: tuning profile of the parameter group, see DATABASE_PROFILES. By default "default"
+DATABASE_DEFAULTS = {
+    "engine": "aurora-postgresql",
+    "engine_version": None,
+    "family": None,
+    "instance_class": "db.t3.medium",
+    "replicas": 1,
+    "storage": 20,
+    "profile": "default",
+}
+
+# Default version, parameter group family and kind of every engine, the kind selects the profile parameters.
+# The versions are minor versions, RDS stops creating databases of a minor version once it is retired, so they have
+# to be bumped when that happens. Existing databases keep running, minor versions are upgraded in place.
+DATABASE_ENGINES = {
+    "aurora-postgresql": {"engine_version": "16.10", "family": "aurora-postgresql16", "kind": "postgres"},
+    "aurora-mysql": {"engine_version": "8.0.mysql_aurora.3.10.0", "family": "aurora-mysql8.0", "kind": "mysql"},
+    "postgres": {"engine_version": "16.10", "family": "postgres16", "kind": "postgres"},
+    "mysql": {"engine_version": "8.0.43", "family": "mysql8.0", "kind": "mysql"},
+}
+
+# Parameters set in the parameter group of the database for every profile and kind of engine
+#  - default: the defaults of the engine
+#  - read-heavy: plans for storage where random reads are cheap, gives sorts and joins more memory and keeps
+#    more tables open, and tracks the statements so the slow ones can be found
+DATABASE_PROFILES = {
+    "default": {"postgres": {}, "mysql": {}},
+    "read-heavy": {
+        "postgres": {
+            "random_page_cost": "1.1",
+            "work_mem": "16384",
+            "shared_preload_libraries": "pg_stat_statements",
+        },
+        "mysql": {
+            "table_open_cache": "4000",
+            "slow_query_log": "1",
+            "long_query_time": "1",
+        },
+    },
+}
+
+# Options of the dashboard and the alarms of the application. Names can use ${Environment} and ${AppName}.
+#  - load_balancer: name of the classic load balancer of the application. By default ${Environment}-${AppName}
+#  - autoscaling_group: optional, name of the autoscaling group of the application, for CPU and network
+#  - log_group: optional, log group of the application, whose JSON lines have a latency field
+#  - latency_field: field of the log lines with the latency in milliseconds. By default latency
+#  - latency_threshold: seconds the p99 latency of the load balancer can take. By default 1
+#  - error_rate_threshold: percentage of requests that can fail with a 5xx. By default 5
+#  - surge_queue_threshold: requests that can wait for an instance in the load balancer. By default 100
+#  - cpu_threshold: average CPU percentage of the instances. By default 80
+#  - alarm_actions: optional, ARNs notified when alarms change state, i.e. SNS topics
+MONITORING_DEFAULTS = {
+    "load_balancer": "${Environment}-${AppName}",
+    "autoscaling_group": None,
+    "log_group": None,
+    "latency_field": "latency",
+    "latency_threshold": 1,
+    "error_rate_threshold": 5,
+    "surge_queue_threshold": 100,
+    "cpu_threshold": 80,
+    "alarm_actions": [],
+}
+
+
+def metric_widget(title, metrics, x, y, **properties):
+    properties.update({"title": title, "region": "${AWS::Region}", "metrics": metrics, "period": 60})
+    return {"type": "metric", "x": x, "y": y, "width": 12, "height": 6, "properties": properties}
+
+
+def add_monitoring(t, monitoring):
+    options = dict(MONITORING_DEFAULTS, **monitoring)
+    unknown = set(options) - set(MONITORING_DEFAULTS)
+    if unknown:
+        raise ValueError("Unknown monitoring options %s" % ", ".join(sorted(unknown)))
+    elb = ["LoadBalancerName", options["load_balancer"]]
+    asg = ["AutoScalingGroupName", options["autoscaling_group"]]
+    namespace = "Wimpy/${Environment}/${AppName}"
+
+    widgets = [
+        metric_widget("Latency", [
+            ["AWS/ELB", "Latency"] + elb + [{"stat": stat, "label": stat}] for stat in ("p50", "p90", "p99")
+        ], 0, 0),
+        metric_widget("Requests", [
+            ["AWS/ELB", "RequestCount"] + elb + [{"stat": "Sum"}],
+        ], 12, 0),
+        metric_widget("5xx rate", [
+            ["AWS/ELB", "HTTPCode_Backend_5XX"] + elb + [{"stat": "Sum", "id": "backend", "visible": False}],
+            ["AWS/ELB", "HTTPCode_ELB_5XX"] + elb + [{"stat": "Sum", "id": "elb", "visible": False}],
+            ["AWS/ELB", "RequestCount"] + elb + [{"stat": "Sum", "id": "requests", "visible": False}],
+            [{"expression": "100 * (FILL(backend, 0) + FILL(elb, 0)) / requests", "label": "5xx %"}],
+        ], 0, 6),
+        metric_widget("Surge queue", [
+            ["AWS/ELB", "SurgeQueueLength"] + elb + [{"stat": "Maximum"}],
+            ["AWS/ELB", "SpilloverCount"] + elb + [{"stat": "Sum"}],
+        ], 12, 6),
+    ]
+    if options["autoscaling_group"]:
+        widgets.extend([
+            metric_widget("CPU", [["AWS/EC2", "CPUUtilization"] + asg + [{"stat": "Average"}]], 0, 12),
+            metric_widget("Network", [
+                ["AWS/EC2", "NetworkIn"] + asg + [{"stat": "Sum"}],
+                ["AWS/EC2", "NetworkOut"] + asg + [{"stat": "Sum"}],
+            ], 12, 12),
+        ])
+    if options["log_group"]:
+        # Latency reported by the application itself, without the time spent in the load balancer
+        t.add_resource(MetricFilter(
+            "LatencyMetricFilter",
+            LogGroupName=Sub(options["log_group"]),
+            FilterPattern="{ $.%s >= 0 }" % options["latency_field"],
+            MetricTransformations=[MetricTransformation(
+                MetricNamespace=Sub(namespace),
+                MetricName="Latency",
+                MetricValue="$.%s" % options["latency_field"],
+            )],
+        ))
+        widgets.append(metric_widget("Application latency (ms)", [
+            [namespace, "Latency", {"stat": stat, "label": stat}] for stat in ("p50", "p90", "p99")
+        ], 0, 18))
+
+    t.add_resource(Dashboard(
+        "Dashboard",
+        DashboardName=Sub("${Environment}-${AppName}"),
+        DashboardBody=Sub(json.dumps({"widgets": widgets}, sort_keys=True)),
+    ))
+
+    def alarm(name, description, threshold, **properties):
+        return t.add_resource(Alarm(
+            name,
+            AlarmName=Sub("${Environment}-${AppName}-%s" % description.lower().replace(" ", "-")),
+            AlarmDescription=Sub("%s of ${Environment}-${AppName}" % description),
+            ComparisonOperator="GreaterThanThreshold",
+            Threshold=threshold,
+            EvaluationPeriods=5,
+            DatapointsToAlarm=3,
+            TreatMissingData="notBreaching",
+            AlarmActions=options["alarm_actions"],
+            OKActions=options["alarm_actions"],
+            **properties
+        ))
+
+    alarms = ["LatencyAlarm", "ErrorRateAlarm", "SurgeQueueAlarm"]
+    alarm(
+        "LatencyAlarm", "Latency", options["latency_threshold"],
+        Namespace="AWS/ELB", MetricName="Latency", ExtendedStatistic="p99", Period=60,
+        Dimensions=[MetricDimension(Name=elb[0], Value=Sub(elb[1]))],
+    )
+
+    def elb_metric(id, name):
+        return MetricDataQuery(
+            Id=id,
+            ReturnData=False,
+            MetricStat=MetricStat(
+                Metric=Metric(Namespace="AWS/ELB", MetricName=name, Dimensions=[MetricDimension(Name=elb[0], Value=Sub(elb[1]))]),
+                Period=60,
+                Stat="Sum",
+            ),
+        )
+
+    alarm(
+        "ErrorRateAlarm", "Error rate", options["error_rate_threshold"],
+        Metrics=[
+            elb_metric("backend", "HTTPCode_Backend_5XX"),
+            elb_metric("elb", "HTTPCode_ELB_5XX"),
+            elb_metric("requests", "RequestCount"),
+            MetricDataQuery(Id="rate", Expression="100 * (FILL(backend, 0) + FILL(elb, 0)) / requests", Label="5xx %"),
+        ],
+    )
+    alarm(
+        "SurgeQueueAlarm", "Surge queue", options["surge_queue_threshold"],
+        Namespace="AWS/ELB", MetricName="SurgeQueueLength", Statistic="Maximum", Period=60,
+        Dimensions=[MetricDimension(Name=elb[0], Value=Sub(elb[1]))],
+    )
+    if options["autoscaling_group"]:
+        alarms.append("CPUAlarm")
+        alarm(
+            "CPUAlarm", "CPU", options["cpu_threshold"],
+            Namespace="AWS/EC2", MetricName="CPUUtilization", Statistic="Average", Period=60,
+            Dimensions=[MetricDimension(Name=asg[0], Value=Sub(asg[1]))],
+        )
+
+    t.add_output(Output(
+        "Dashboard",
+        Value=Ref("Dashboard"),
+        Description="CloudWatch dashboard of the application")
+    )
+    for name in alarms:
+        t.add_output(Output(
+            name,
+            Value=Ref(name),
+            Description="CloudWatch alarm of the application")
+        )
+
+
+# Placement strategies of the instances of the application
+#  - cluster: packs instances close together in one availability zone, for the lowest latency between them
+#  - spread: places every instance on distinct hardware, for at most 7 instances per zone
+#  - partition: spreads groups of instances over distinct racks, for large distributed systems
+PLACEMENT_STRATEGIES = ["cluster", "spread", "partition"]
+
+
+class PlacementGroup(ec2.PlacementGroup):
+    # troposphere 2.7.1 doesn't know the number of partitions of a partition placement group
+    props = dict(ec2.PlacementGroup.props, PartitionCount=(integer, False))
+
+
+def add_placement_group(t, placement):
+    options = dict({"partitions": 2}, **placement)
+    unknown = set(options) - set(["strategy", "partitions"])
+    if unknown:
+        raise ValueError("Unknown placement options %s" % ", ".join(sorted(unknown)))
+    if options.get("strategy") not in PLACEMENT_STRATEGIES:
+        raise ValueError("Unknown placement strategy %s, choose from %s" % (options.get("strategy"), ", ".join(PLACEMENT_STRATEGIES)))
+
+    properties = {"Strategy": options["strategy"]}
+    if options["strategy"] == "partition":
+        properties["PartitionCount"] = int(options["partitions"])
+    t.add_resource(PlacementGroup("PlacementGroup", **properties))
+
+    t.add_output(Output(
+        "PlacementGroup",
+        Value=Ref("PlacementGroup"),
+        Description="Placement group for application instances")
+    )
+
+
+# Options of the ECR repository of the application, named environment/name
+#  - untagged_days: days after untagged images are expired. By default 7
+#  - keep_images: number of most recent images kept, older ones are expired. By default 30
+#  - scan_on_push: scan every image for vulnerabilities when it is pushed. By default true
+REPOSITORY_DEFAULTS = {
+    "untagged_days": 7,
+    "keep_images": 30,
+    "scan_on_push": True,
+}
+
+
+def add_repository(t, repository):
+    options = dict(REPOSITORY_DEFAULTS, **(repository or {}))
+    unknown = set(options) - set(REPOSITORY_DEFAULTS)
+    if unknown:
+        raise ValueError("Unknown repository options %s" % ", ".join(sorted(unknown)))
+
+    # https://docs.aws.amazon.com/AmazonECR/latest/userguide/LifecyclePolicies.html
+    lifecycle = {
+        "rules": [{
+            "rulePriority": 1,
+            "description": "Expire untagged images",
+            "selection": {
+                "tagStatus": "untagged",
+                "countType": "sinceImagePushed",
+                "countUnit": "days",
+                "countNumber": int(options["untagged_days"]),
+            },
+            "action": {"type": "expire"},
         }, {
-            "Action": [
-                "logs:CreateLogGroup",
-                "logs:CreateLogStream",
-                "logs:PutLogEvents",
-                "logs:DescribeLogStreams"
-            ],
-            "Resource": Join(":", ["arn:aws:logs", Ref("AWS::Region"), Ref("AWS::AccountId"), "log-group", Join("", ["/", Ref(environment), "/", Ref(appName), "/*"]), "log-stream", "*"]),
-            "Effect": "Allow",
-            "Sid": "allowScopedLogAccess"
+            "rulePriority": 2,
+            "description": "Keep the most recent images",
+            "selection": {
+                "tagStatus": "any",
+                "countType": "imageCountMoreThan",
+                "countNumber": int(options["keep_images"]),
+            },
+            "action": {"type": "expire"},
         }]
-    },
-))
-
-t.add_output(Output(
-    "LoadBalancerSecurityGroup",
-    Value=Ref("LoadBalancerSecurityGroup"),
-    Description="Security group for load balancers")
-)
-t.add_output(Output(
-    "InstanceSecurityGroup",
-    Value=Ref("InstanceSecurityGroup"),
-    Description="Security group for application instances")
-)
-t.add_output(Output(
-    "DBSecurityGroup",
-    Value=Ref("DBSecurityGroup"),
-    Description="Security group for databases")
-)
-t.add_output(Output(
-    "IAMRole",
-    Value=Ref("IAMRole"),
-    Description="Role that allows access to ssm and xray")
-)
-t.add_output(Output(
-    "IAMInstanceProfile",
-    Value=Ref("IAMInstanceProfile"),
-    Description="Instance profile for application instances")
-)
-
-print(t.to_json())
+    }
+
+    t.add_resource(Repository(
+        "Repository",
+        RepositoryName=Join("/", [Ref("Environment"), Ref("AppName")]),
+        LifecyclePolicy=LifecyclePolicy(
+            LifecyclePolicyText=json.dumps(lifecycle, sort_keys=True),
+        ),
+        ImageScanningConfiguration={"ScanOnPush": bool(options["scan_on_push"])},
+        Tags=Tags(
+            Name=Join("-", [Ref("Environment"), Ref("AppName")]),
+        ),
+    ))
+
+    t.add_output(Output(
+        "RepositoryUri",
+        Value=Join("", [Ref("AWS::AccountId"), ".dkr.ecr.", Ref("AWS::Region"), ".amazonaws.com/", Ref("Repository")]),
+        Description="URI of the ECR repository of the application")
+    )
+
+
+def add_database(t, database, availability_zones):
+    options = dict(DATABASE_DEFAULTS, **database)
+    unknown = set(options) - set(DATABASE_DEFAULTS)
+    if unknown:
+        raise ValueError("Unknown database options %s" % ", ".join(sorted(unknown)))
+    if options["engine"] not in DATABASE_ENGINES:
+        raise ValueError("Unknown database engine %s, choose from %s" % (options["engine"], ", ".join(sorted(DATABASE_ENGINES))))
+    if options["profile"] not in DATABASE_PROFILES:
+        raise ValueError("Unknown database profile %s, choose from %s" % (options["profile"], ", ".join(sorted(DATABASE_PROFILES))))
+    engine = DATABASE_ENGINES[options["engine"]]
+    aurora = options["engine"].startswith("aurora-")
+    replicas = int(options["replicas"])
+
+    def zone(index):
+        return zone_name(availability_zones[index % len(availability_zones)])
+
+    t.add_parameter(Parameter(
+        "RDSSubnetGroup",
+        Type="String",
+        Description="RDS subnet group of the environment",
+    ))
+
+    # The master password never leaves Secrets Manager, instances read it with their role
+    t.add_resource(Secret(
+        "DatabaseSecret",
+        Description=Join("-", [Ref("Environment"), Ref("AppName"), "database"]),
+        KmsKeyId=Ref("MasterKey"),
+        GenerateSecretString=GenerateSecretString(
+            SecretStringTemplate='{"username": "wimpy"}',
+            GenerateStringKey="password",
+            PasswordLength=32,
+            ExcludeCharacters='"@/\\',
+        ),
+    ))
+    username = Join("", ["{{resolve:secretsmanager:", Ref("DatabaseSecret"), ":SecretString:username}}"])
+    password = Join("", ["{{resolve:secretsmanager:", Ref("DatabaseSecret"), ":SecretString:password}}"])
+
+    t.add_resource(PolicyType(
+        "DatabaseSecretPolicy",
+        PolicyName=Join("-", [Ref("AWS::StackName"), "database"]),
+        Roles=[Ref("IAMRole")],
+        PolicyDocument={
+            "Version": "2012-10-17",
+            "Statement": [{
+                "Action": ["secretsmanager:GetSecretValue"],
+                "Resource": Ref("DatabaseSecret"),
+                "Effect": "Allow",
+                "Sid": "allowDatabaseSecret"
+            }]
+        },
+    ))
+
+    t.add_resource(DBParameterGroup(
+        "DatabaseParameterGroup",
+        Family=options["family"] or engine["family"],
+        Description=Join("-", [Ref("Environment"), Ref("AppName"), options["profile"]]),
+        Parameters=DATABASE_PROFILES[options["profile"]][engine["kind"]],
+    ))
+
+    if aurora:
+        # Aurora replicas share the storage of the writer, and the writer and the replicas take the availability zones
+        # of the environment in turn
+        t.add_resource(DBCluster(
+            "Database",
+            DeletionPolicy="Snapshot",
+            UpdateReplacePolicy="Snapshot",
+            Engine=options["engine"],
+            EngineVersion=options["engine_version"] or engine["engine_version"],
+            DBSubnetGroupName=Ref("RDSSubnetGroup"),
+            VpcSecurityGroupIds=[Ref("DBSecurityGroup")],
+            MasterUsername=username,
+            MasterUserPassword=password,
+            StorageEncrypted=True,
+            KmsKeyId=Ref("MasterKey"),
+            BackupRetentionPeriod=7,
+            Tags=Tags(
+                Name=Join("-", [Ref("Environment"), Ref("AppName")]),
+            ),
+        ))
+        for index in range(replicas + 1):
+            t.add_resource(DBInstance(
+                "DatabaseInstance%d" % (index + 1),
+                DBClusterIdentifier=Ref("Database"),
+                AvailabilityZone=zone(index),
+                Engine=options["engine"],
+                DBInstanceClass=options["instance_class"],
+                DBParameterGroupName=Ref("DatabaseParameterGroup"),
+                DBSubnetGroupName=Ref("RDSSubnetGroup"),
+                Tags=Tags(
+                    Name=Join("-", [Ref("Environment"), Ref("AppName")]),
+                ),
+            ))
+        reader = GetAtt("Database", "ReadEndpoint.Address")
+    else:
+        t.add_resource(DBInstance(
+            "Database",
+            DeletionPolicy="Snapshot",
+            UpdateReplacePolicy="Snapshot",
+            AvailabilityZone=zone(0),
+            Engine=options["engine"],
+            EngineVersion=options["engine_version"] or engine["engine_version"],
+            DBInstanceClass=options["instance_class"],
+            AllocatedStorage=str(options["storage"]),
+            StorageType="gp2",
+            DBParameterGroupName=Ref("DatabaseParameterGroup"),
+            DBSubnetGroupName=Ref("RDSSubnetGroup"),
+            VPCSecurityGroups=[Ref("DBSecurityGroup")],
+            MasterUsername=username,
+            MasterUserPassword=password,
+            StorageEncrypted=True,
+            KmsKeyId=Ref("MasterKey"),
+            # Read replicas need backups of the source instance
+            BackupRetentionPeriod="7",
+            Tags=Tags(
+                Name=Join("-", [Ref("Environment"), Ref("AppName")]),
+            ),
+        ))
+        for index in range(replicas):
+            t.add_resource(DBInstance(
+                "DatabaseReplica%d" % (index + 1),
+                SourceDBInstanceIdentifier=Ref("Database"),
+                AvailabilityZone=zone(index + 1),
+                Engine=options["engine"],
+                DBInstanceClass=options["instance_class"],
+                DBParameterGroupName=Ref("DatabaseParameterGroup"),
+                Tags=Tags(
+                    Name=Join("-", [Ref("Environment"), Ref("AppName"), "replica"]),
+                ),
+            ))
+        reader = Join(",", [GetAtt("DatabaseReplica%d" % (index + 1), "Endpoint.Address") for index in range(replicas)])
+
+    t.add_resource(SecretTargetAttachment(
+        "DatabaseSecretAttachment",
+        SecretId=Ref("DatabaseSecret"),
+        TargetId=Ref("Database"),
+        TargetType="AWS::RDS::DBCluster" if aurora else "AWS::RDS::DBInstance",
+    ))
+
+    t.add_output(Output(
+        "DatabaseEndpoint",
+        Value=GetAtt("Database", "Endpoint.Address"),
+        Description="Address of the writer of the database")
+    )
+    t.add_output(Output(
+        "DatabasePort",
+        Value=GetAtt("Database", "Endpoint.Port"),
+        Description="Port of the database")
+    )
+    if aurora or replicas:
+        # Aurora balances reads over its replicas behind a single address, RDS replicas have one address each
+        t.add_output(Output(
+            "DatabaseReaderEndpoint",
+            Value=reader,
+            Description="Addresses for reads, separated by commas when there are many")
+        )
+    t.add_output(Output(
+        "DatabaseSecret",
+        Value=Ref("DatabaseSecret"),
+        Description="Secret with the master user and password of the database")
+    )
+
+
+def add_cache(t, cache):
+    options = dict(CACHE_DEFAULTS, **cache)
+    unknown = set(options) - set(CACHE_DEFAULTS)
+    if unknown:
+        raise ValueError("Unknown cache options %s" % ", ".join(sorted(unknown)))
+    if options["engine"] != "redis":
+        raise ValueError("Unsupported cache engine %s, only redis is supported" % options["engine"])
+    if options["profile"] not in CACHE_PROFILES:
+        raise ValueError("Unknown cache profile %s, choose from %s" % (options["profile"], ", ".join(sorted(CACHE_PROFILES))))
+    shards = int(options["shards"])
+    replicas = int(options["replicas"])
+    clustered = shards > 1
+
+    t.add_parameter(Parameter(
+        "ElastiCacheSubnetGroup",
+        Type="String",
+        Description="ElastiCache subnet group of the environment",
+    ))
+
+    t.add_resource(SecurityGroup(
+        "CacheSecurityGroup",
+        SecurityGroupIngress=[
+            {
+                "SourceSecurityGroupId": Ref("InstanceSecurityGroup"),
+                "FromPort": 6379,
+                "ToPort": 6379,
+                "IpProtocol": "tcp"
+            }
+        ],
+        VpcId=Ref("VPC"),
+        GroupDescription=Join("-", [Ref("Environment"), Ref("AppName"), "cache"]),
+        Tags=Tags(
+            Name=Join("-", [Ref("Environment"), Ref("AppName"), "cache"]),
+        ),
+    ))
+
+    properties = dict(CACHE_PROFILES[options["profile"]])
+    if clustered:
+        properties["cluster-enabled"] = "yes"
+    t.add_resource(ParameterGroup(
+        "CacheParameterGroup",
+        CacheParameterGroupFamily=options["family"],
+        Description=Join("-", [Ref("Environment"), Ref("AppName"), options["profile"]]),
+        Properties=properties,
+    ))
+
+    replication = {
+        "ReplicationGroupDescription": Join("-", [Ref("Environment"), Ref("AppName")]),
+        "Engine": options["engine"],
+        "EngineVersion": options["engine_version"],
+        "CacheNodeType": options["node_type"],
+        "CacheParameterGroupName": Ref("CacheParameterGroup"),
+        "CacheSubnetGroupName": Ref("ElastiCacheSubnetGroup"),
+        "SecurityGroupIds": [Ref("CacheSecurityGroup")],
+        # Replicas take over when the primary of their shard fails, cluster mode always needs it
+        "AutomaticFailoverEnabled": clustered or replicas > 0,
+        "MultiAZEnabled": replicas > 0,
+        "AtRestEncryptionEnabled": True,
+        "KmsKeyId": Ref("MasterKey"),
+        "Tags": Tags(
+            Name=Join("-", [Ref("Environment"), Ref("AppName")]),
+        ),
+    }
+    if clustered:
+        replication["NumNodeGroups"] = shards
+        replication["ReplicasPerNodeGroup"] = replicas
+    else:
+        replication["NumCacheClusters"] = replicas + 1
+    t.add_resource(ReplicationGroup("Cache", **replication))
+
+    # Clients of a cluster discover the shards through the configuration endpoint
+    endpoint = "ConfigurationEndPoint" if clustered else "PrimaryEndPoint"
+    t.add_output(Output(
+        "CacheEndpoint",
+        Value=GetAtt("Cache", "%s.Address" % endpoint),
+        Description="Address of the cache")
+    )
+    t.add_output(Output(
+        "CachePort",
+        Value=GetAtt("Cache", "%s.Port" % endpoint),
+        Description="Port of the cache")
+    )
+    if not clustered and replicas:
+        t.add_output(Output(
+            "CacheReaderEndpoint",
+            Value=GetAtt("Cache", "ReaderEndPoint.Address"),
+            Description="Address balancing reads over the replicas of the cache")
+        )
+
+
+def create_template(cache=None, database=None, repository=None, placement=None, monitoring=None, availability_zones=None):
+    # cache and database are optional dictionaries with the options of the cache and of the database of the
+    # application, see CACHE_DEFAULTS and DATABASE_DEFAULTS. repository overrides REPOSITORY_DEFAULTS.
+    # placement is an optional dictionary with the strategy of a placement group, and its partitions
+    # monitoring is an optional dictionary with the options of the dashboard and alarms, see MONITORING_DEFAULTS,
+    # or true for the defaults
+    # availability_zones are the zones of the subnets of the environment, the database instances take them in turn
+    availability_zones = availability_zones or AVAILABILITY_ZONES
+    t = Template()
+
+    t.add_version("2010-09-09")
+    t.add_description("Stack that creates resources needed for a specific application")
+
+    vpcId = t.add_parameter(Parameter(
+        "VPC",
+        Type="String",
+        Description="VPC ID",
+    ))
+    environment = t.add_parameter(Parameter(
+        "Environment",
+        Type="String",
+        Description="Environment where this is deployed",
+    ))
+    appName = t.add_parameter(Parameter(
+        "AppName",
+        Type="String",
+        Description="Name of the application",
+    ))
+    appPort = t.add_parameter(Parameter(
+        "AppPort",
+        Type="String",
+        Description="Port where the application will be listening",
+    ))
+    appProtocol = t.add_parameter(Parameter(
+        "AppProtocol",
+        Type="String",
+        Description="Protocol used by the application",
+    ))
+    exposedPort = t.add_parameter(Parameter(
+        "ExposedPort",
+        Type="String",
+        Description="Port where the load balancer will be listening",
+    ))
+    MasterKey = t.add_parameter(Parameter(
+        "MasterKey",
+        Type="String",
+        Description="KMS key used",
+    ))
+    StorageBucketName = t.add_parameter(Parameter(
+        "StorageBucketName",
+        Type="String",
+        Description="S3 Bucket for application data storage",
+    ))
+
+
+    LoadBalancerSecurityGroup = t.add_resource(SecurityGroup(
+        "LoadBalancerSecurityGroup",
+        SecurityGroupIngress=[
+            {
+                "ToPort": Ref(exposedPort),
+                "FromPort": Ref(exposedPort),
+                "IpProtocol": "tcp",
+                "CidrIp": "0.0.0.0/0"
+            }
+        ],
+        VpcId=Ref(vpcId),
+        GroupDescription=Join("-", [Ref(environment), Ref(appName), "elb"]),
+        Tags=Tags(
+            Name=Join("-", [Ref(environment), Ref(appName), "elb"]),
+        ),
+    ))
+
+    InstanceSecurityGroup = t.add_resource(SecurityGroup(
+        "InstanceSecurityGroup",
+        VpcId=Ref(vpcId),
+        GroupDescription=Join("-", [Ref(environment), Ref(appName), "instances"]),
+        Tags=Tags(
+            Name=Join("-", [Ref(environment), Ref(appName), "instances"]),
+        ),
+    ))
+
+    IngressForELB = t.add_resource(SecurityGroupIngress(
+        "IngressForELB",
+        IpProtocol=Ref(appProtocol),
+        FromPort=Ref(appPort),
+        ToPort=Ref(appPort),
+        SourceSecurityGroupId=Ref("LoadBalancerSecurityGroup"),
+        GroupId=Ref("InstanceSecurityGroup")
+    ))
+    IngressForInstances = t.add_resource(SecurityGroupIngress(
+        "IngressForInstances",
+        IpProtocol=Ref(appProtocol),
+        FromPort=Ref(appPort),
+        ToPort=Ref(appPort),
+        SourceSecurityGroupId=Ref("InstanceSecurityGroup"),
+        GroupId=Ref("InstanceSecurityGroup")
+    ))
+    IngressForSSH = t.add_resource(SecurityGroupIngress(
+        "IngressForSSH",
+        IpProtocol="tcp",
+        FromPort=22,
+        ToPort=22,
+        CidrIp="0.0.0.0/0",
+        GroupId=Ref("InstanceSecurityGroup")
+    ))
+
+    DBSecurityGroup = t.add_resource(SecurityGroup(
+        "DBSecurityGroup",
+        SecurityGroupIngress=[
+            {
+                "SourceSecurityGroupId": Ref("InstanceSecurityGroup"),
+                "FromPort": 0,
+                "ToPort": 65535,
+                "IpProtocol": "tcp"
+            }
+        ],
+        VpcId=Ref(vpcId),
+        GroupDescription=Join("-", [Ref(environment), Ref(appName), "db"]),
+        Tags=Tags(
+            Name=Join("-", [Ref(environment), Ref(appName), "db"]),
+        ),
+    ))
+
+    # Profile for application instances
+    IAMInstanceProfile = t.add_resource(InstanceProfile(
+        "IAMInstanceProfile",
+        Path=Join("", ["/", Ref(environment), "/", Ref(appName), "/"]),
+        Roles=[Ref("IAMRole")],
+    ))
+
+    # Role for application instances
+    IAMRole = t.add_resource(Role(
+        "IAMRole",
+        Path=Join("", ["/", Ref(environment), "/", Ref(appName), "/"]),
+        ManagedPolicyArns=[
+            "arn:aws:iam::aws:policy/service-role/AmazonEC2RoleforSSM",
+            "arn:aws:iam::aws:policy/AWSXrayFullAccess",
+            "arn:aws:iam::aws:policy/AmazonEC2ContainerRegistryReadOnly"
+        ],
+        AssumeRolePolicyDocument={
+            "Statement": [
+                {
+                    "Action": ["sts:AssumeRole"],
+                    "Effect": "Allow",
+                    "Principal": {"Service": "ec2.amazonaws.com"}
+                }
+            ]
+        },
+    ))
+
+    # Policy for instances so they can access the KMS key, CloudWatch LogGroup, S3 bucket, describe stack resources and describe ELB instances
+    IAMPolicy = t.add_resource(PolicyType(
+        "IAMPolicy",
+        PolicyName=Join("-", [Ref("AWS::StackName"), "policy"]),
+        Roles=[Ref(IAMRole)],
+        PolicyDocument={
+            "Version": "2012-10-17",
+            "Statement": [{
+                "Action": ["s3:*"],
+                "Resource": Join("", ["arn:aws:s3:::", Ref(StorageBucketName), "/", Ref(environment), "/", Ref(appName), "/"]),
+                "Effect": "Allow",
+                "Sid": "allowScopedS3AccessRoot"
+            }, {
+                "Action": ["s3:*"],
+                "Resource": Join("", ["arn:aws:s3:::", Ref(StorageBucketName), "/", Ref(environment), "/", Ref(appName), "/*"]),
+                "Effect": "Allow",
+                "Sid": "allowScopedS3Access"
+            }, {
+                "Action": [
+                    "kms:Encrypt",
+                    "kms:Decrypt",
+                    "kms:ReEncrypt*",
+                    "kms:GenerateDataKey*",
+                    "kms:DescribeKey"
+                ],
+                "Resource": Join("/", [Join(":", ["arn:aws:kms", Ref("AWS::Region"), Ref("AWS::AccountId"), "key"]), Ref("MasterKey")]),
+                "Effect": "Allow",
+                "Sid": "allowKMSUse"
+            }, {
+                "Action": [
+                    "elasticloadbalancing:DescribeInstanceHealth",
+                ],
+                "Resource": "*",
+                "Effect": "Allow",
+                "Sid": "allowDescribeELBInstances"
+            },  {
+                "Action": [
+                    "cloudformation:DescribeStackResources",
+                ],
+                "Resource": "*",
+                "Effect": "Allow",
+                "Sid": "allowDescribeStackResources"
+            },  {
+                "Action": [
+                    "ec2:DescribeInstances",
+                ],
+                "Resource": "*",
+                "Effect": "Allow",
+                "Sid": "allowDescribeEC2Instances"
+            }, {
+                "Action": [
+                    "logs:CreateLogGroup",
+                    "logs:CreateLogStream",
+                    "logs:PutLogEvents",
+                    "logs:DescribeLogStreams"
+                ],
+                "Resource": Join(":", ["arn:aws:logs", Ref("AWS::Region"), Ref("AWS::AccountId"), "log-group", Join("", ["/", Ref(environment), "/", Ref(appName), "/*"]), "log-stream", "*"]),
+                "Effect": "Allow",
+                "Sid": "allowScopedLogAccess"
+            }]
+        },
+    ))
+
+    t.add_output(Output(
+        "LoadBalancerSecurityGroup",
+        Value=Ref("LoadBalancerSecurityGroup"),
+        Description="Security group for load balancers")
+    )
+    t.add_output(Output(
+        "InstanceSecurityGroup",
+        Value=Ref("InstanceSecurityGroup"),
+        Description="Security group for application instances")
+    )
+    t.add_output(Output(
+        "DBSecurityGroup",
+        Value=Ref("DBSecurityGroup"),
+        Description="Security group for databases")
+    )
+    t.add_output(Output(
+        "IAMRole",
+        Value=Ref("IAMRole"),
+        Description="Role that allows access to ssm and xray")
+    )
+    t.add_output(Output(
+        "IAMInstanceProfile",
+        Value=Ref("IAMInstanceProfile"),
+        Description="Instance profile for application instances")
+    )
+
+    add_repository(t, repository)
+    if placement:
+        add_placement_group(t, placement)
+    if monitoring:
+        add_monitoring(t, monitoring if isinstance(monitoring, dict) else {})
+    if cache:
+        add_cache(t, cache)
+    if database:
+        add_database(t, database, availability_zones)
+
+    return t
+
+
+if __name__ == "__main__":
+    print(create_template().to_json())
@@ -1,285 +1,844 @@
-from troposphere import Join, GetAtt, Output
+from troposphere import AWSObject, Join, GetAtt, Output
 from troposphere import Ref, Tags, Template
+from troposphere.cloudfront import CacheBehavior, CloudFrontOriginAccessIdentity, CloudFrontOriginAccessIdentityConfig
+from troposphere.cloudfront import DefaultCacheBehavior, Distribution, DistributionConfig, ForwardedValues
+from troposphere.cloudfront import Logging, Origin, S3OriginConfig
+from troposphere.athena import EncryptionConfiguration, ResultConfiguration, WorkGroup, WorkGroupConfiguration
 from troposphere.cloudtrail import Trail
+from troposphere.ecr import ReplicationConfigurationProperty, ReplicationDestination, ReplicationRule
+from troposphere.glue import Column, Database, DatabaseInput, SerdeInfo, StorageDescriptor, Table, TableInput
 from troposphere.iam import Role, Policy
 from troposphere.kms import Key
 from troposphere.s3 import Bucket, BucketPolicy, LoggingConfiguration, CorsConfiguration, CorsRules
+from troposphere.s3 import AbortIncompleteMultipartUpload, AccelerateConfiguration, BucketEncryption
+from troposphere.s3 import ServerSideEncryptionByDefault, ServerSideEncryptionRule
+from troposphere.s3 import LifecycleConfiguration, LifecycleRule, LifecycleRuleTransition
 from troposphere.logs import LogGroup
 
-t = Template()
-
-t.add_version("2010-09-09")
-t.add_description("Stack that creates resources shared for all applications inside your AWS account")
-
-# https://docs.aws.amazon.com/elasticloadbalancing/latest/classic/enable-access-logs.html
-t.add_mapping("Principals", {
-    "ap-northeast-1": {"ELB": "582318560864"},
-    "ap-northeast-2": {"ELB": "600734575887"},
-    "ap-southeast-1": {"ELB": "114774131450"},
-    "ap-southeast-2": {"ELB": "783225319266"},
-    "ap-south-1": {"ELB": "718504428378"},
-    "ca-central-1": {"ELB": "985666609251"},
-    "eu-west-1": {"ELB": "156460612806"},
-    "eu-west-2": {"ELB": "652711504416"},
-    "eu-central-1": {"ELB": "054676820928"},
-    "sa-east-1": {"ELB": "507241528517"},
-    "us-west-1": {"ELB": "027434742980"},
-    "us-west-2": {"ELB": "797873946194"},
-    "us-east-1": {"ELB": "127311923021"},
-    "us-east-2": {"ELB": "033677994240"}
-})
-
-# Bucket for ELB access logs, S3 access logs and CloudTrail audit log
-LogBucket = t.add_resource(Bucket(
-    "LogBucket",
-    # Allows S3 to write S3 access logs
-    AccessControl="LogDeliveryWrite",
-    Tags=Tags(
-        Name=Join(" ", [Ref("AWS::StackName"), "Logs"]),
-        Managed="Wimpy",
-    ),
-))
-
-# Bucket for the application to store images/files/whatever
-# S3 Access Log https://docs.aws.amazon.com/AmazonS3/latest/dev/ServerLogs.html
-StorageBucket = t.add_resource(Bucket(
-    "StorageBucket",
-    # Enable access log for this bucket
-    LoggingConfiguration=LoggingConfiguration(
-        # The name of an S3 bucket where AWS stores the access log for this bucket
-        DestinationBucketName=Ref("LogBucket"),
-        # A prefix for the all log object keys
-        LogFilePrefix="S3AccessLogs/"
-    ),
-    Tags=Tags(
-        Name=Join(" ", [Ref("AWS::StackName"), "Storage"]),
-        Managed="Wimpy",
-    ),
-))
-
-# Policy for LogBucket so CloudTrail and ELB can write logs in it
-LogPolicy = t.add_resource(BucketPolicy(
-    "LogPolicy",
-    Bucket=Ref("LogBucket"),
-    PolicyDocument={
-        "Version": "2012-10-17",
-        "Statement": [
+class RegistryReplication(AWSObject):
+    # troposphere.ecr.ReplicationConfiguration has the resource type of a repository
+    resource_type = "AWS::ECR::ReplicationConfiguration"
+
+    props = {
+        "ReplicationConfiguration": (ReplicationConfigurationProperty, True),
+    }
+
+
+# Optional CloudFront distribution in front of StorageBucket
+#  - applications: list of applications whose files are served, every one with its environment and name, and
+#    optionally its own default_ttl and max_ttl. Only the environment/name/ prefix of these applications is served.
+#  - price_class: edge locations of the distribution. By default PriceClass_100, North America and Europe
+#  - default_ttl: seconds objects are cached when the origin doesn't say otherwise. By default 86400
+#  - max_ttl: maximum seconds objects are cached. By default 31536000
+DISTRIBUTION_DEFAULTS = {
+    "applications": [],
+    "price_class": "PriceClass_100",
+    "default_ttl": 86400,
+    "max_ttl": 31536000,
+}
+
+# Lifecycle rules of a bucket are lists of dictionaries with
+#  - id: name of the rule
+#  - prefix: optional, objects the rule applies to. By default the whole bucket
+#  - transitions: optional, list of days after creation and the storage class objects move to then,
+#    i.e. STANDARD_IA, INTELLIGENT_TIERING or GLACIER
+#  - expiration_days: optional, days after creation objects are deleted
+#  - abort_multipart_days: optional, days after incomplete multipart uploads are aborted and their parts deleted
+LIFECYCLE_RULE_KEYS = ["id", "prefix", "transitions", "expiration_days", "abort_multipart_days"]
+
+
+def lifecycle_configuration(rules):
+    lifecycle_rules = []
+    for rule in rules:
+        unknown = set(rule) - set(LIFECYCLE_RULE_KEYS)
+        if unknown:
+            raise ValueError("Unknown options %s in lifecycle rule %s" % (", ".join(sorted(unknown)), rule.get("id")))
+        properties = {"Id": rule["id"], "Status": "Enabled", "Prefix": rule.get("prefix", "")}
+        if rule.get("transitions"):
+            properties["Transitions"] = [
+                LifecycleRuleTransition(StorageClass=transition["storage_class"], TransitionInDays=transition["days"])
+                for transition in rule["transitions"]
+            ]
+        if rule.get("expiration_days"):
+            properties["ExpirationInDays"] = rule["expiration_days"]
+        if rule.get("abort_multipart_days"):
+            properties["AbortIncompleteMultipartUpload"] = AbortIncompleteMultipartUpload(
+                DaysAfterInitiation=rule["abort_multipart_days"],
+            )
+        lifecycle_rules.append(LifecycleRule(**properties))
+    return LifecycleConfiguration(Rules=lifecycle_rules)
+
+
+def add_distribution(t, distribution):
+    options = dict(DISTRIBUTION_DEFAULTS, **distribution)
+    unknown = set(options) - set(DISTRIBUTION_DEFAULTS)
+    if unknown:
+        raise ValueError("Unknown distribution options %s" % ", ".join(sorted(unknown)))
+    prefixes = ["%s/%s/" % (application["environment"], application["name"]) for application in options["applications"]]
+
+    t.add_resource(CloudFrontOriginAccessIdentity(
+        "StorageOriginAccessIdentity",
+        CloudFrontOriginAccessIdentityConfig=CloudFrontOriginAccessIdentityConfig(
+            Comment=Join(" ", [Ref("AWS::StackName"), "Storage"]),
+        ),
+    ))
+
+    # CloudFront reads only the prefixes of the applications, the rest of the bucket stays private
+    if prefixes:
+        t.add_resource(BucketPolicy(
+            "StoragePolicy",
+            Bucket=Ref("StorageBucket"),
+            PolicyDocument={
+                "Version": "2012-10-17",
+                "Statement": [{
+                    "Sid": "CloudFrontRead",
+                    "Effect": "Allow",
+                    "Principal": {"CanonicalUser": GetAtt("StorageOriginAccessIdentity", "S3CanonicalUserId")},
+                    "Action": "s3:GetObject",
+                    "Resource": [Join("", ["arn:aws:s3:::", Ref("StorageBucket"), "/", prefix, "*"]) for prefix in prefixes],
+                }]
+            }
+        ))
+
+    def behavior(cls, application, **kwargs):
+        return cls(
+            TargetOriginId="StorageBucket",
+            ViewerProtocolPolicy="redirect-to-https",
+            AllowedMethods=["GET", "HEAD"],
+            CachedMethods=["GET", "HEAD"],
+            Compress=True,
+            ForwardedValues=ForwardedValues(QueryString=False),
+            DefaultTTL=application.get("default_ttl", options["default_ttl"]),
+            MaxTTL=application.get("max_ttl", options["max_ttl"]),
+            **kwargs
+        )
+
+    t.add_resource(Distribution(
+        "StorageDistribution",
+        DistributionConfig=DistributionConfig(
+            Comment=Join(" ", [Ref("AWS::StackName"), "Storage"]),
+            Enabled=True,
+            HttpVersion="http2",
+            IPV6Enabled=True,
+            PriceClass=options["price_class"],
+            Origins=[Origin(
+                Id="StorageBucket",
+                DomainName=GetAtt("StorageBucket", "RegionalDomainName"),
+                S3OriginConfig=S3OriginConfig(
+                    OriginAccessIdentity=Join("", ["origin-access-identity/cloudfront/", Ref("StorageOriginAccessIdentity")]),
+                ),
+            )],
+            DefaultCacheBehavior=behavior(DefaultCacheBehavior, {}),
+            CacheBehaviors=[
+                behavior(CacheBehavior, application, PathPattern="%s*" % prefix)
+                for application, prefix in zip(options["applications"], prefixes)
+            ],
+            Logging=Logging(
+                Bucket=GetAtt("LogBucket", "DomainName"),
+                Prefix="CloudFrontLogs/",
+            ),
+        ),
+    ))
+
+    t.add_output(Output(
+        "StorageDistribution",
+        Value=Ref("StorageDistribution"),
+        Description="CloudFront distribution of the bucket for applications")
+    )
+    t.add_output(Output(
+        "StorageDistributionDomain",
+        Value=GetAtt("StorageDistribution", "DomainName"),
+        Description="Domain of the CloudFront distribution of the bucket for applications")
+    )
+
+
+# Optional Glue database with a table over every log prefix of LogBucket, and an Athena workgroup to query them.
+# Tables use partition projection, so partitions are computed from the query instead of being crawled or added.
+#  - database: name of the Glue database. By default wimpy_logs
+#  - workgroup: name of the Athena workgroup. By default wimpy-logs
+#  - bytes_scanned_cutoff: bytes a single query can scan before it is cancelled. By default 10 GiB
+#  - results_expiration_days: days query results are kept under AthenaResults/ in LogBucket. By default 7
+#  - since: first day of the projected partitions, as yyyy/MM/dd. By default 2020/01/01
+ANALYTICS_DEFAULTS = {
+    "database": "wimpy_logs",
+    "workgroup": "wimpy-logs",
+    "bytes_scanned_cutoff": 10 * 1024 ** 3,
+    "results_expiration_days": 7,
+    "since": "2020/01/01",
+}
+ANALYTICS_RESULTS_PREFIX = "AthenaResults/"
+
+TEXT_FORMATS = ("org.apache.hadoop.mapred.TextInputFormat", "org.apache.hadoop.hive.ql.io.HiveIgnoreKeyTextOutputFormat")
+PARQUET_FORMATS = (
+    "org.apache.hadoop.hive.ql.io.parquet.MapredParquetInputFormat",
+    "org.apache.hadoop.hive.ql.io.parquet.MapredParquetOutputFormat",
+)
+
+# https://docs.aws.amazon.com/athena/latest/ug/cloudtrail-logs.html
+CLOUDTRAIL_COLUMNS = [
+    ("eventversion", "string"),
+    ("useridentity", "struct<type:string,principalid:string,arn:string,accountid:string,invokedby:string,accesskeyid:string,"
+                     "username:string,sessioncontext:struct<attributes:struct<mfaauthenticated:string,creationdate:string>,"
+                     "sessionissuer:struct<type:string,principalid:string,arn:string,accountid:string,username:string>>>"),
+    ("eventtime", "string"),
+    ("eventsource", "string"),
+    ("eventname", "string"),
+    ("awsregion", "string"),
+    ("sourceipaddress", "string"),
+    ("useragent", "string"),
+    ("errorcode", "string"),
+    ("errormessage", "string"),
+    ("requestparameters", "string"),
+    ("responseelements", "string"),
+    ("additionaleventdata", "string"),
+    ("requestid", "string"),
+    ("eventid", "string"),
+    ("resources", "array<struct<arn:string,accountid:string,type:string>>"),
+    ("eventtype", "string"),
+    ("apiversion", "string"),
+    ("readonly", "string"),
+    ("recipientaccountid", "string"),
+    ("serviceeventdetails", "string"),
+    ("sharedeventid", "string"),
+    ("vpcendpointid", "string"),
+]
+
+# https://docs.aws.amazon.com/athena/latest/ug/elasticloadbalancer-classic-logs.html
+ELB_COLUMNS = [
+    ("request_timestamp", "string"),
+    ("elb_name", "string"),
+    ("request_ip", "string"),
+    ("request_port", "int"),
+    ("backend_ip", "string"),
+    ("backend_port", "int"),
+    ("request_processing_time", "double"),
+    ("backend_processing_time", "double"),
+    ("client_response_time", "double"),
+    ("elb_response_code", "string"),
+    ("backend_response_code", "string"),
+    ("received_bytes", "bigint"),
+    ("sent_bytes", "bigint"),
+    ("request_verb", "string"),
+    ("url", "string"),
+    ("protocol", "string"),
+    ("user_agent", "string"),
+    ("ssl_cipher", "string"),
+    ("ssl_protocol", "string"),
+]
+ELB_REGEX = (
+    '([^ ]*) ([^ ]*) ([^ ]*):([0-9]*) ([^ ]*)[:-]([0-9]*) ([-.0-9]*) ([-.0-9]*) ([-.0-9]*) (|[-0-9]*) (-|[-0-9]*) '
+    '([-0-9]*) ([-0-9]*) "([^ ]*) ([^ ]*) (- |[^ ]*)" ("[^"]*") ([A-Z0-9-]+) ([A-Za-z0-9.-]*)$'
+)
+
+# https://docs.aws.amazon.com/AmazonS3/latest/userguide/using-s3-access-logs-to-identify-requests.html
+S3_ACCESS_COLUMNS = [
+    ("bucketowner", "string"),
+    ("bucket_name", "string"),
+    ("requestdatetime", "string"),
+    ("remoteip", "string"),
+    ("requester", "string"),
+    ("requestid", "string"),
+    ("operation", "string"),
+    ("key", "string"),
+    ("request_uri", "string"),
+    ("httpstatus", "string"),
+    ("errorcode", "string"),
+    ("bytessent", "bigint"),
+    ("objectsize", "bigint"),
+    ("totaltime", "string"),
+    ("turnaroundtime", "string"),
+    ("referrer", "string"),
+    ("useragent", "string"),
+    ("versionid", "string"),
+    ("hostid", "string"),
+    ("sigv", "string"),
+    ("ciphersuite", "string"),
+    ("authtype", "string"),
+    ("endpoint", "string"),
+    ("tlsversion", "string"),
+]
+S3_ACCESS_REGEX = (
+    '([^ ]*) ([^ ]*) \\[(.*?)\\] ([^ ]*) ([^ ]*) ([^ ]*) ([^ ]*) ([^ ]*) ("[^"]*"|-) (-|[0-9]*) ([^ ]*) ([^ ]*) '
+    '([^ ]*) ([^ ]*) ([^ ]*) ([^ ]*) ("[^"]*"|-) ([^ ]*)(?: ([^ ]*) ([^ ]*) ([^ ]*) ([^ ]*) ([^ ]*) ([^ ]*))?.*$'
+)
+
+# https://docs.aws.amazon.com/athena/latest/ug/cloudfront-logs.html
+CLOUDFRONT_COLUMNS = [
+    ("log_date", "date"),
+    ("log_time", "string"),
+    ("location", "string"),
+    ("bytes", "bigint"),
+    ("request_ip", "string"),
+    ("method", "string"),
+    ("host", "string"),
+    ("uri", "string"),
+    ("status", "int"),
+    ("referrer", "string"),
+    ("user_agent", "string"),
+    ("query_string", "string"),
+    ("cookie", "string"),
+    ("result_type", "string"),
+    ("request_id", "string"),
+    ("host_header", "string"),
+    ("request_protocol", "string"),
+    ("request_bytes", "bigint"),
+    ("time_taken", "float"),
+    ("xforwarded_for", "string"),
+    ("ssl_protocol", "string"),
+    ("ssl_cipher", "string"),
+    ("response_result_type", "string"),
+    ("http_version", "string"),
+    ("fle_status", "string"),
+    ("fle_encrypted_fields", "int"),
+    ("c_port", "int"),
+    ("time_to_first_byte", "float"),
+    ("x_edge_detailed_result_type", "string"),
+    ("sc_content_type", "string"),
+    ("sc_content_len", "bigint"),
+    ("sc_range_start", "bigint"),
+    ("sc_range_end", "bigint"),
+]
+
+# Fields of the default format of flow logs, and the Parquet types of the fields that aren't strings
+# https://docs.aws.amazon.com/vpc/latest/userguide/flow-logs-records-examples.html
+FLOW_LOG_FIELDS = [
+    "version", "account-id", "interface-id", "srcaddr", "dstaddr", "srcport", "dstport", "protocol",
+    "packets", "bytes", "start", "end", "action", "log-status",
+]
+FLOW_LOG_TYPES = {
+    "version": "int",
+    "srcport": "int",
+    "dstport": "int",
+    "protocol": "bigint",
+    "packets": "bigint",
+    "bytes": "bigint",
+    "start": "bigint",
+    "end": "bigint",
+    "tcp-flags": "int",
+    "traffic-path": "int",
+}
+
+
+def log_location(*parts):
+    return Join("", ["s3://", Ref("LogBucket"), "/"] + list(parts))
+
+
+def day_projection(partition, location, since, date_format="yyyy/MM/dd", unit="DAYS"):
+    # Parameters projecting a date partition whose values are the date part of the keys under location
+    return {
+        "projection.enabled": "true",
+        "projection.%s.type" % partition: "date",
+        "projection.%s.format" % partition: date_format,
+        "projection.%s.range" % partition: "%s,NOW" % since,
+        "projection.%s.interval" % partition: "1",
+        "projection.%s.interval.unit" % partition: unit,
+        "storage.location.template": Join("", [location, "${%s}/" % partition]),
+    }
+
+
+def add_log_table(t, name, table, columns, location, formats, serde, serde_parameters=None, partitions=None,
+                  parameters=None):
+    t.add_resource(Table(
+        name,
+        CatalogId=Ref("AWS::AccountId"),
+        DatabaseName=Ref("LogDatabase"),
+        TableInput=TableInput(
+            Name=table,
+            TableType="EXTERNAL_TABLE",
+            Parameters=dict(parameters or {}, EXTERNAL="TRUE"),
+            PartitionKeys=[Column(Name=partition, Type="string") for partition in partitions or []],
+            StorageDescriptor=StorageDescriptor(
+                Columns=[Column(Name=column, Type=column_type) for column, column_type in columns],
+                Location=location,
+                InputFormat=formats[0],
+                OutputFormat=formats[1],
+                SerdeInfo=SerdeInfo(SerializationLibrary=serde, Parameters=serde_parameters or {}),
+            ),
+        ),
+    ))
+
+
+def add_analytics(t, analytics, log_bucket, regions, distribution=False, flow_logs=None):
+    options = dict(ANALYTICS_DEFAULTS, **analytics)
+    unknown = set(options) - set(ANALYTICS_DEFAULTS)
+    if unknown:
+        raise ValueError("Unknown analytics options %s" % ", ".join(sorted(unknown)))
+    since = options["since"]
+
+    t.add_resource(Database(
+        "LogDatabase",
+        CatalogId=Ref("AWS::AccountId"),
+        DatabaseInput=DatabaseInput(
+            Name=options["database"],
+            Description=Join(" ", [Ref("AWS::StackName"), "Logs"]),
+        ),
+    ))
+
+    # The trail logs every region, so the region is a partition as well
+    cloudtrail = log_location("AWSLogs/", Ref("AWS::AccountId"), "/CloudTrail/")
+    add_log_table(
+        t, "CloudTrailTable", "cloudtrail_logs", CLOUDTRAIL_COLUMNS, cloudtrail,
+        ("com.amazon.emr.cloudtrail.CloudTrailInputFormat", TEXT_FORMATS[1]),
+        "com.amazon.emr.hive.serde.CloudTrailSerde",
+        partitions=["region", "day"],
+        parameters=dict(
+            day_projection("day", Join("", [cloudtrail, "${region}/"]), since),
+            **{"projection.region.type": "enum", "projection.region.values": ",".join(sorted(regions))}
+        ),
+    )
+
+    elb = log_location("ELBLogs/AWSLogs/", Ref("AWS::AccountId"), "/elasticloadbalancing/", Ref("AWS::Region"), "/")
+    add_log_table(
+        t, "ELBTable", "elb_logs", ELB_COLUMNS, elb, TEXT_FORMATS, "org.apache.hadoop.hive.serde2.RegexSerDe",
+        serde_parameters={"serialization.format": "1", "input.regex": ELB_REGEX},
+        partitions=["day"],
+        parameters=day_projection("day", elb, since),
+    )
+
+    # Keys of S3 access logs have no date prefix, so they can't be partitioned and queries read the whole prefix
+    add_log_table(
+        t, "S3AccessTable", "s3_access_logs", S3_ACCESS_COLUMNS, log_location("S3AccessLogs/"), TEXT_FORMATS,
+        "org.apache.hadoop.hive.serde2.RegexSerDe",
+        serde_parameters={"serialization.format": "1", "input.regex": S3_ACCESS_REGEX},
+    )
+
+    if distribution:
+        add_log_table(
+            t, "CloudFrontTable", "cloudfront_logs", CLOUDFRONT_COLUMNS, log_location("CloudFrontLogs/"), TEXT_FORMATS,
+            "org.apache.hadoop.hive.serde2.lazy.LazySimpleSerDe",
+            serde_parameters={"field.delim": "\t", "serialization.format": "\t"},
+            parameters={"skip.header.line.count": "2"},
+        )
+
+    if flow_logs:
+        flow_logs = flow_logs if isinstance(flow_logs, dict) else {}
+        if flow_logs.get("hive_partitions"):
+            location = log_location(
+                "VPCFlowLogs/AWSLogs/aws-account-id=", Ref("AWS::AccountId"),
+                "/aws-service=vpcflowlogs/aws-region=", Ref("AWS::Region"), "/",
+            )
+            hour_format = "'year='yyyy'/month='MM'/day='dd'/hour='HH"
+            hour_since = "year=%s/month=%s/day=%s/hour=00" % tuple(since.split("/"))
+        else:
+            location = log_location("VPCFlowLogs/AWSLogs/", Ref("AWS::AccountId"), "/vpcflowlogs/", Ref("AWS::Region"), "/")
+            hour_format = "yyyy/MM/dd/HH"
+            hour_since = since + "/00"
+        add_log_table(
+            t, "VPCFlowTable", "vpc_flow_logs",
+            [(field.replace("-", "_"), FLOW_LOG_TYPES.get(field, "string")) for field in flow_logs.get("fields") or FLOW_LOG_FIELDS],
+            location, PARQUET_FORMATS, "org.apache.hadoop.hive.ql.io.parquet.serde.ParquetHiveSerDe",
+            partitions=["hour"],
+            parameters=day_projection("hour", location, hour_since, hour_format, "HOURS"),
+        )
+
+    t.add_resource(WorkGroup(
+        "LogWorkGroup",
+        Name=options["workgroup"],
+        Description=Join(" ", [Ref("AWS::StackName"), "Logs"]),
+        # Results are kept with the workgroup, deleting it must not fail because of them
+        RecursiveDeleteOption=True,
+        WorkGroupConfiguration=WorkGroupConfiguration(
+            BytesScannedCutoffPerQuery=int(options["bytes_scanned_cutoff"]),
+            EnforceWorkGroupConfiguration=True,
+            PublishCloudWatchMetricsEnabled=True,
+            ResultConfiguration=ResultConfiguration(
+                OutputLocation=log_location(ANALYTICS_RESULTS_PREFIX),
+                EncryptionConfiguration=EncryptionConfiguration(EncryptionOption="SSE_S3"),
+            ),
+        ),
+    ))
+
+    # Query results are only useful for a while, so their prefix doesn't grow forever
+    results_rule = lifecycle_configuration([{
+        "id": "AthenaResults",
+        "prefix": ANALYTICS_RESULTS_PREFIX,
+        "expiration_days": int(options["results_expiration_days"]),
+    }]).Rules[0]
+    if "LifecycleConfiguration" in log_bucket.properties:
+        log_bucket.LifecycleConfiguration.Rules.append(results_rule)
+    else:
+        log_bucket.LifecycleConfiguration = LifecycleConfiguration(Rules=[results_rule])
+
+    t.add_output(Output(
+        "LogDatabase",
+        Value=Ref("LogDatabase"),
+        Description="Glue database with the tables of the logs")
+    )
+    t.add_output(Output(
+        "LogWorkGroup",
+        Value=Ref("LogWorkGroup"),
+        Description="Athena workgroup to query the logs")
+    )
+
+
+def create_template(distribution=None, log_lifecycle=None, storage_lifecycle=None, acceleration=False, replication_regions=None,
+                    flow_logs=None, analytics=None, encryption=False):
+    # distribution is an optional dictionary with the options of the CloudFront distribution, see DISTRIBUTION_DEFAULTS
+    # log_lifecycle and storage_lifecycle are optional lifecycle rules of LogBucket and StorageBucket, see LIFECYCLE_RULE_KEYS
+    # acceleration enables Transfer Acceleration on StorageBucket
+    # replication_regions is an optional list of regions every ECR repository of the account is replicated to
+    # flow_logs allows VPC flow logs to be delivered to LogBucket, it is the dictionary with the options of the flow logs
+    # of the environments, or true for the defaults
+    # analytics is an optional dictionary with the options of the tables over the logs, see ANALYTICS_DEFAULTS
+    # encryption makes StorageBucket encrypt new objects with MasterKey by default
+    t = Template()
+
+    t.add_version("2010-09-09")
+    t.add_description("Stack that creates resources shared for all applications inside your AWS account")
+
+    # https://docs.aws.amazon.com/elasticloadbalancing/latest/classic/enable-access-logs.html
+    t.add_mapping("Principals", {
+        "ap-northeast-1": {"ELB": "582318560864"},
+        "ap-northeast-2": {"ELB": "600734575887"},
+        "ap-southeast-1": {"ELB": "114774131450"},
+        "ap-southeast-2": {"ELB": "783225319266"},
+        "ap-south-1": {"ELB": "718504428378"},
+        "ca-central-1": {"ELB": "985666609251"},
+        "eu-west-1": {"ELB": "156460612806"},
+        "eu-west-2": {"ELB": "652711504416"},
+        "eu-central-1": {"ELB": "054676820928"},
+        "sa-east-1": {"ELB": "507241528517"},
+        "us-west-1": {"ELB": "027434742980"},
+        "us-west-2": {"ELB": "797873946194"},
+        "us-east-1": {"ELB": "127311923021"},
+        "us-east-2": {"ELB": "033677994240"}
+    })
+
+    # Bucket for ELB access logs, S3 access logs and CloudTrail audit log
+    LogBucket = t.add_resource(Bucket(
+        "LogBucket",
+        # Allows S3 to write S3 access logs
+        AccessControl="LogDeliveryWrite",
+        Tags=Tags(
+            Name=Join(" ", [Ref("AWS::StackName"), "Logs"]),
+            Managed="Wimpy",
+        ),
+    ))
+
+    # Bucket for the application to store images/files/whatever
+    # S3 Access Log https://docs.aws.amazon.com/AmazonS3/latest/dev/ServerLogs.html
+    StorageBucket = t.add_resource(Bucket(
+        "StorageBucket",
+        # Enable access log for this bucket
+        LoggingConfiguration=LoggingConfiguration(
+            # The name of an S3 bucket where AWS stores the access log for this bucket
+            DestinationBucketName=Ref("LogBucket"),
+            # A prefix for the all log object keys
+            LogFilePrefix="S3AccessLogs/"
+        ),
+        Tags=Tags(
+            Name=Join(" ", [Ref("AWS::StackName"), "Storage"]),
+            Managed="Wimpy",
+        ),
+    ))
+
+    if log_lifecycle:
+        LogBucket.LifecycleConfiguration = lifecycle_configuration(log_lifecycle)
+    if storage_lifecycle:
+        StorageBucket.LifecycleConfiguration = lifecycle_configuration(storage_lifecycle)
+    if acceleration:
+        # Uploads and downloads go through the closest CloudFront edge location
+        StorageBucket.AccelerateConfiguration = AccelerateConfiguration(AccelerationStatus="Enabled")
+    if encryption:
+        # With a bucket key S3 asks KMS for a data key once in a while instead of once per object.
+        # LogBucket keeps S3 managed keys, S3 and ELB access logs can't be delivered to buckets encrypted with KMS.
+        StorageBucket.BucketEncryption = BucketEncryption(
+            ServerSideEncryptionConfiguration=[ServerSideEncryptionRule(
+                BucketKeyEnabled=True,
+                ServerSideEncryptionByDefault=ServerSideEncryptionByDefault(
+                    SSEAlgorithm="aws:kms",
+                    KMSMasterKeyID=GetAtt("MasterKey", "Arn"),
+                ),
+            )],
+        )
+
+    # Policy for LogBucket so CloudTrail and ELB can write logs in it
+    LogPolicy = t.add_resource(BucketPolicy(
+        "LogPolicy",
+        Bucket=Ref("LogBucket"),
+        PolicyDocument={
+            "Version": "2012-10-17",
+            "Statement": [
+                {
+                    # https://docs.aws.amazon.com/awscloudtrail/latest/userguide/create-s3-bucket-policy-for-cloudtrail.html
+                    "Sid": "AWSCloudTrailAclCheck",
+                    "Effect": "Allow",
+                    "Principal": {"Service": "cloudtrail.amazonaws.com"},
+                    "Action": "s3:GetBucketAcl",
+                    "Resource": {
+                        "Fn::Join": ["", ["arn:aws:s3:::", Ref("LogBucket")]]
+                    }
+                },
+                {
+                    # CloudTrail automatically writes to the bucket_name/AWSLogs/account_ID/ folder,
+                    # so the bucket policy grants write privileges for that prefix
+                    # https://docs.aws.amazon.com/AWSCloudFormation/latest/UserGuide/aws-resource-cloudtrail-trail.html#w1ab2c19c12d143c15
+                    "Sid": "AWSCloudTrailWrite",
+                    "Effect": "Allow",
+                    "Principal": {"Service": "cloudtrail.amazonaws.com"},
+                    "Action": "s3:PutObject",
+                    "Resource": {
+                        "Fn::Join": ["", ["arn:aws:s3:::", Ref("LogBucket"), "/AWSLogs/", Ref("AWS::AccountId"), "/*"]]
+                    },
+                    "Condition": {
+                        "StringEquals": {"s3:x-amz-acl": "bucket-owner-full-control"}
+                    }
+                },
+                {
+                    # https://docs.aws.amazon.com/elasticloadbalancing/latest/classic/enable-access-logs.html
+                    "Sid": "AWSELBLogWrite",
+                    "Effect": "Allow",
+                    "Action": "s3:PutObject",
+                    "Resource": {
+                        "Fn::Join": ["", ["arn:aws:s3:::", Ref("LogBucket"), "/ELBLogs/*"]]
+                    },
+                    "Principal": {
+                        "AWS": [{"Fn::FindInMap": ["Principals", Ref("AWS::Region"), "ELB"]}]
+                    }
+                }
+            ]
+        }
+    ))
+
+    if flow_logs:
+        # Hive compatible partitions put the account id in a key=value prefix
+        if isinstance(flow_logs, dict) and flow_logs.get("hive_partitions"):
+            flow_log_prefix = "/VPCFlowLogs/AWSLogs/aws-account-id="
+        else:
+            flow_log_prefix = "/VPCFlowLogs/AWSLogs/"
+        # https://docs.aws.amazon.com/vpc/latest/userguide/flow-logs-s3.html#flow-logs-s3-permissions
+        LogPolicy.PolicyDocument["Statement"].extend([
             {
-                # https://docs.aws.amazon.com/awscloudtrail/latest/userguide/create-s3-bucket-policy-for-cloudtrail.html
-                "Sid": "AWSCloudTrailAclCheck",
+                "Sid": "AWSLogDeliveryAclCheck",
                 "Effect": "Allow",
-                "Principal": {"Service": "cloudtrail.amazonaws.com"},
+                "Principal": {"Service": "delivery.logs.amazonaws.com"},
                 "Action": "s3:GetBucketAcl",
                 "Resource": {
                     "Fn::Join": ["", ["arn:aws:s3:::", Ref("LogBucket")]]
-                }
-            },
-            {
-                # CloudTrail automatically writes to the bucket_name/AWSLogs/account_ID/ folder,
-                # so the bucket policy grants write privileges for that prefix
-                # https://docs.aws.amazon.com/AWSCloudFormation/latest/UserGuide/aws-resource-cloudtrail-trail.html#w1ab2c19c12d143c15
-                "Sid": "AWSCloudTrailWrite",
-                "Effect": "Allow",
-                "Principal": {"Service": "cloudtrail.amazonaws.com"},
-                "Action": "s3:PutObject",
-                "Resource": {
-                    "Fn::Join": ["", ["arn:aws:s3:::", Ref("LogBucket"), "/AWSLogs/", Ref("AWS::AccountId"), "/*"]]
                 },
                 "Condition": {
-                    "StringEquals": {"s3:x-amz-acl": "bucket-owner-full-control"}
+                    "StringEquals": {"aws:SourceAccount": Ref("AWS::AccountId")}
                 }
             },
             {
-                # https://docs.aws.amazon.com/elasticloadbalancing/latest/classic/enable-access-logs.html
-                "Sid": "AWSELBLogWrite",
+                "Sid": "AWSLogDeliveryWrite",
                 "Effect": "Allow",
+                "Principal": {"Service": "delivery.logs.amazonaws.com"},
                 "Action": "s3:PutObject",
                 "Resource": {
-                    "Fn::Join": ["", ["arn:aws:s3:::", Ref("LogBucket"), "/ELBLogs/*"]]
+                    "Fn::Join": ["", ["arn:aws:s3:::", Ref("LogBucket"), flow_log_prefix, Ref("AWS::AccountId"), "/*"]]
                 },
-                "Principal": {
-                    "AWS": [{"Fn::FindInMap": ["Principals", Ref("AWS::Region"), "ELB"]}]
+                "Condition": {
+                    "StringEquals": {"s3:x-amz-acl": "bucket-owner-full-control", "aws:SourceAccount": Ref("AWS::AccountId")}
                 }
             }
-        ]
-    }
-))
-
-# Role that Amazon CloudWatch Logs assumes to write logs to a log group
-# https://docs.aws.amazon.com/awscloudtrail/latest/userguide/cloudtrail-required-policy-for-cloudwatch-logs.html
-IAMRole = t.add_resource(Role(
-    "CloudTrailLoggingRole",
-    Path="/cloudtrail/",
-    Policies=[Policy(
-        PolicyName="CloudTrailLogging",
-        PolicyDocument={
+        ])
+
+    # Role that Amazon CloudWatch Logs assumes to write logs to a log group
+    # https://docs.aws.amazon.com/awscloudtrail/latest/userguide/cloudtrail-required-policy-for-cloudwatch-logs.html
+    IAMRole = t.add_resource(Role(
+        "CloudTrailLoggingRole",
+        Path="/cloudtrail/",
+        Policies=[Policy(
+            PolicyName="CloudTrailLogging",
+            PolicyDocument={
+                "Version": "2012-10-17",
+                "Statement": [{
+                    "Sid": "AWSCloudTrailCreateLogStream2014110",
+                    "Effect": "Allow",
+                    "Action": ["logs:CreateLogStream"],
+                    "Resource": [{
+                        "Fn::GetAtt": ["CloudTrailLogs", "Arn"]
+                    }]
+                }, {
+                    "Sid": "AWSCloudTrailPutLogEvents20141101",
+                    "Effect": "Allow",
+                    "Action": ["logs:PutLogEvents"],
+                    "Resource": [{
+                        "Fn::GetAtt": ["CloudTrailLogs", "Arn"]
+                    }]
+                }]
+            })
+        ],
+        AssumeRolePolicyDocument={
+            "Statement": [{
+                "Action": ["sts:AssumeRole"],
+                "Effect": "Allow",
+                "Principal": {"Service": "cloudtrail.amazonaws.com"}
+            }]
+        },
+    ))
+
+    # CloudWatch Log Group where CloudTrail will log
+    CloudTrailLogs = t.add_resource(LogGroup(
+        "CloudTrailLogs"
+    ))
+
+    CloudTrail = t.add_resource(Trail(
+        "CloudTrail",
+        DependsOn=["LogPolicy"],
+        # ARN of a log group to which CloudTrail logs will be delivered
+        CloudWatchLogsLogGroupArn=GetAtt("CloudTrailLogs", "Arn"),
+        # Role that Amazon CloudWatch Logs assumes to write logs to a log group
+        CloudWatchLogsRoleArn=GetAtt("CloudTrailLoggingRole", "Arn"),
+        # Indicates whether CloudTrail validates the integrity of log files
+        EnableLogFileValidation=True,
+        # Whether the trail is publishing events from global services, such as IAM, to the log files
+        IncludeGlobalServiceEvents=True,
+        # Indicates whether the CloudTrail trail is currently logging AWS API calls
+        IsLogging=True,
+        # Whether the trail is created in the region in which you create the stack or in all regions
+        IsMultiRegionTrail=True,
+        # The AWS KMS key ID that you want to use to encrypt CloudTrail logs
+        KMSKeyId=Ref("MasterKey"),
+        # The name of the Amazon S3 bucket where CloudTrail publishes log files
+        S3BucketName=Ref("LogBucket"),
+        # An Amazon S3 object key prefix that precedes the name of all log files
+        # S3KeyPrefix="",
+        # The name of an Amazon SNS topic that is notified when new log files are published
+        # SnsTopicName=GetAtt(Topic, "TopicName"),
+    ))
+
+    # The AWS KMS key used to encrypt CloudTrail logs
+    # https://docs.aws.amazon.com/awscloudtrail/latest/userguide/default-cmk-policy.html
+    MasterKey = t.add_resource(Key(
+        "MasterKey",
+        Description="Master Key for this Account",
+        Enabled=True,
+        EnableKeyRotation=True,
+        KeyPolicy={
             "Version": "2012-10-17",
             "Statement": [{
-                "Sid": "AWSCloudTrailCreateLogStream2014110",
+                "Sid": "Enable IAM User Permissions",
                 "Effect": "Allow",
-                "Action": ["logs:CreateLogStream"],
-                "Resource": [{
-                    "Fn::GetAtt": ["CloudTrailLogs", "Arn"]
-                }]
+                "Principal": {
+                    "AWS": {
+                        "Fn::Join": [":", ["arn:aws:iam:", Ref("AWS::AccountId"), "root"]]
+                    }
+                },
+                "Action": "kms:*",
+                "Resource": "*"
             }, {
-                "Sid": "AWSCloudTrailPutLogEvents20141101",
+                # https://docs.aws.amazon.com/awscloudtrail/latest/userguide/create-kms-key-policy-for-cloudtrail-encrypt.html
+                "Sid": "Allow CloudTrail to encrypt logs",
                 "Effect": "Allow",
-                "Action": ["logs:PutLogEvents"],
-                "Resource": [{
-                    "Fn::GetAtt": ["CloudTrailLogs", "Arn"]
-                }]
-            }]
-        })
-    ],
-    AssumeRolePolicyDocument={
-        "Statement": [{
-            "Action": ["sts:AssumeRole"],
-            "Effect": "Allow",
-            "Principal": {"Service": "cloudtrail.amazonaws.com"}
-        }]
-    },
-))
-
-# CloudWatch Log Group where CloudTrail will log
-CloudTrailLogs = t.add_resource(LogGroup(
-    "CloudTrailLogs"
-))
-
-CloudTrail = t.add_resource(Trail(
-    "CloudTrail",
-    DependsOn=["LogPolicy"],
-    # ARN of a log group to which CloudTrail logs will be delivered
-    CloudWatchLogsLogGroupArn=GetAtt("CloudTrailLogs", "Arn"),
-    # Role that Amazon CloudWatch Logs assumes to write logs to a log group
-    CloudWatchLogsRoleArn=GetAtt("CloudTrailLoggingRole", "Arn"),
-    # Indicates whether CloudTrail validates the integrity of log files
-    EnableLogFileValidation=True,
-    # Whether the trail is publishing events from global services, such as IAM, to the log files
-    IncludeGlobalServiceEvents=True,
-    # Indicates whether the CloudTrail trail is currently logging AWS API calls
-    IsLogging=True,
-    # Whether the trail is created in the region in which you create the stack or in all regions
-    IsMultiRegionTrail=True,
-    # The AWS KMS key ID that you want to use to encrypt CloudTrail logs
-    KMSKeyId=Ref("MasterKey"),
-    # The name of the Amazon S3 bucket where CloudTrail publishes log files
-    S3BucketName=Ref("LogBucket"),
-    # An Amazon S3 object key prefix that precedes the name of all log files
-    # S3KeyPrefix="",
-    # The name of an Amazon SNS topic that is notified when new log files are published
-    # SnsTopicName=GetAtt(Topic, "TopicName"),
-))
-
-# The AWS KMS key used to encrypt CloudTrail logs
-# https://docs.aws.amazon.com/awscloudtrail/latest/userguide/default-cmk-policy.html
-MasterKey = t.add_resource(Key(
-    "MasterKey",
-    Description="Master Key for this Account",
-    Enabled=True,
-    EnableKeyRotation=True,
-    KeyPolicy={
-        "Version": "2012-10-17",
-        "Statement": [{
-            "Sid": "Enable IAM User Permissions",
-            "Effect": "Allow",
-            "Principal": {
-                "AWS": {
-                    "Fn::Join": [":", ["arn:aws:iam:", Ref("AWS::AccountId"), "root"]]
-                }
-            },
-            "Action": "kms:*",
-            "Resource": "*"
-        }, {
-            # https://docs.aws.amazon.com/awscloudtrail/latest/userguide/create-kms-key-policy-for-cloudtrail-encrypt.html
-            "Sid": "Allow CloudTrail to encrypt logs",
-            "Effect": "Allow",
-            "Principal": {
-                "Service": ["cloudtrail.amazonaws.com"]
-            },
-            "Action": "kms:GenerateDataKey*",
-            "Resource": "*",
-            "Condition": {
-                "StringLike": {
-                    "kms:EncryptionContext:aws:cloudtrail:arn": {
-                        "Fn::Join": ["", ["arn:aws:cloudtrail:*:", Ref("AWS::AccountId"), ":trail/*"]]
+                "Principal": {
+                    "Service": ["cloudtrail.amazonaws.com"]
+                },
+                "Action": "kms:GenerateDataKey*",
+                "Resource": "*",
+                "Condition": {
+                    "StringLike": {
+                        "kms:EncryptionContext:aws:cloudtrail:arn": {
+                            "Fn::Join": ["", ["arn:aws:cloudtrail:*:", Ref("AWS::AccountId"), ":trail/*"]]
+                        }
                     }
                 }
-            }
-        }, {
-            "Sid": "Allow CloudTrail to describe key",
-            "Effect": "Allow",
-            "Principal": {
-                "Service": ["cloudtrail.amazonaws.com"]
-            },
-            "Action": "kms:DescribeKey",
-            "Resource": "*"
-        }, {
-            "Sid": "Allow principals in the account to decrypt log files",
-            "Effect": "Allow",
-            "Principal": {
-                "AWS": "*"
-            },
-            "Action": ["kms:Decrypt", "kms:ReEncryptFrom"],
-            "Resource": "*",
-            "Condition": {
-                "StringEquals": {
-                    "kms:CallerAccount": Ref("AWS::AccountId")
+            }, {
+                "Sid": "Allow CloudTrail to describe key",
+                "Effect": "Allow",
+                "Principal": {
+                    "Service": ["cloudtrail.amazonaws.com"]
+                },
+                "Action": "kms:DescribeKey",
+                "Resource": "*"
+            }, {
+                "Sid": "Allow principals in the account to decrypt log files",
+                "Effect": "Allow",
+                "Principal": {
+                    "AWS": "*"
                 },
-                "StringLike": {
-                    "kms:EncryptionContext:aws:cloudtrail:arn": {
-                        "Fn::Join": ["", ["arn:aws:cloudtrail:*:", Ref("AWS::AccountId"), ":trail/*"]]
+                "Action": ["kms:Decrypt", "kms:ReEncryptFrom"],
+                "Resource": "*",
+                "Condition": {
+                    "StringEquals": {
+                        "kms:CallerAccount": Ref("AWS::AccountId")
+                    },
+                    "StringLike": {
+                        "kms:EncryptionContext:aws:cloudtrail:arn": {
+                            "Fn::Join": ["", ["arn:aws:cloudtrail:*:", Ref("AWS::AccountId"), ":trail/*"]]
+                        }
                     }
                 }
-            }
-        }, {
-            "Sid": "Allow alias creation during setup",
-            "Effect": "Allow",
-            "Principal": {"AWS": "*"},
-            "Action": "kms:CreateAlias",
-            "Resource": "*",
-            "Condition": {"StringEquals": {
-                "kms:ViaService": {
-                    "Fn::Join": [".", ["ec2", Ref("AWS::Region"), "amazonaws.com"]]
-                },
-                "kms:CallerAccount": Ref("AWS::AccountId")
-            }}
-        }, {
-            "Sid": "Enable cross account log decryption",
-            "Effect": "Allow",
-            "Principal": {
-                "AWS": "*"
-            },
-            "Action": ["kms:Decrypt", "kms:ReEncryptFrom"],
-            "Resource": "*",
-            "Condition": {
-                "StringEquals": {
+            }, {
+                "Sid": "Allow alias creation during setup",
+                "Effect": "Allow",
+                "Principal": {"AWS": "*"},
+                "Action": "kms:CreateAlias",
+                "Resource": "*",
+                "Condition": {"StringEquals": {
+                    "kms:ViaService": {
+                        "Fn::Join": [".", ["ec2", Ref("AWS::Region"), "amazonaws.com"]]
+                    },
                     "kms:CallerAccount": Ref("AWS::AccountId")
+                }}
+            }, {
+                "Sid": "Enable cross account log decryption",
+                "Effect": "Allow",
+                "Principal": {
+                    "AWS": "*"
                 },
-                "StringLike": {
-                    "kms:EncryptionContext:aws:cloudtrail:arn": {
-                        "Fn::Join": ["", ["arn:aws:cloudtrail:*:", Ref("AWS::AccountId"), ":trail/*"]]
+                "Action": ["kms:Decrypt", "kms:ReEncryptFrom"],
+                "Resource": "*",
+                "Condition": {
+                    "StringEquals": {
+                        "kms:CallerAccount": Ref("AWS::AccountId")
+                    },
+                    "StringLike": {
+                        "kms:EncryptionContext:aws:cloudtrail:arn": {
+                            "Fn::Join": ["", ["arn:aws:cloudtrail:*:", Ref("AWS::AccountId"), ":trail/*"]]
+                        }
                     }
                 }
-            }
-        }]
-    }
-))
+            }]
+        }
+    ))
 
-t.add_output(Output(
-    "LogBucket",
-    Value=Ref("LogBucket"),
-    Description="Bucket for logs CloudTrail and ELB logs")
-)
-t.add_output(Output(
-    "StorageBucket",
-    Value=Ref("StorageBucket"),
-    Description="Bucket for applications to store data")
-)
-t.add_output(Output(
-    "MasterKey",
-    Value=Ref("MasterKey"),
-    Description="KMS Key to encrypt CloudTrail logs")
-)
+    t.add_output(Output(
+        "LogBucket",
+        Value=Ref("LogBucket"),
+        Description="Bucket for logs CloudTrail and ELB logs")
+    )
+    t.add_output(Output(
+        "StorageBucket",
+        Value=Ref("StorageBucket"),
+        Description="Bucket for applications to store data")
+    )
+    t.add_output(Output(
+        "MasterKey",
+        Value=Ref("MasterKey"),
+        Description="KMS Key to encrypt CloudTrail logs")
+    )
+
+    # Replication is configured once for the whole registry, so it belongs to this stack instead of the applications
+    if replication_regions:
+        t.add_resource(RegistryReplication(
+            "RegistryReplication",
+            ReplicationConfiguration=ReplicationConfigurationProperty(
+                Rules=[ReplicationRule(
+                    Destinations=[
+                        ReplicationDestination(Region=region, RegistryId=Ref("AWS::AccountId"))
+                        for region in replication_regions
+                    ],
+                )],
+            ),
+        ))
+
+    if acceleration:
+        t.add_output(Output(
+            "StorageBucketAccelerateEndpoint",
+            Value=Join("", [Ref("StorageBucket"), ".s3-accelerate.amazonaws.com"]),
+            Description="Transfer Acceleration endpoint of the bucket for applications")
+        )
+
+    if distribution:
+        add_distribution(t, distribution)
+
+    if analytics:
+        add_analytics(t, analytics, LogBucket, t.mappings["Principals"].keys(), bool(distribution), flow_logs)
+
+    return t
 
 
-print(t.to_json())
+if __name__ == "__main__":
+    print(create_template().to_json())
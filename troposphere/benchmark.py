@@ -0,0 +1,156 @@
+import argparse
+import json
+import platform
+import time
+
+import troposphere
+
+import addressing
+import application
+import base
+import environment
+
+try:
+    import tracemalloc
+except ImportError:
+    # Python 2 has no way to measure the peak memory of a single stack
+    tracemalloc = None
+
+# Measures how long the generators take to build every template and to serialize it with
+# to_json(), and the peak memory used by each stack. Besides the stacks the role renders,
+# it includes synthetic cases with hundreds of environments and thousands of applications,
+# and the stacks with every option enabled.
+
+# Options of the stacks with every option enabled
+BASE_OPTIONS = (
+    {"applications": [{"environment": "environment%d" % index, "name": "application"} for index in range(20)]},
+    [{"id": "Logs", "transitions": [{"days": 30, "storage_class": "STANDARD_IA"}], "abort_multipart_days": 7}],
+    [{"id": "IncompleteUploads", "abort_multipart_days": 7}],
+    True,
+    ["us-east-1", "eu-central-1"],
+    {"fields": ["version", "account-id", "interface-id", "srcaddr", "dstaddr", "az-id", "flow-direction"]},
+    {"since": "2023/01/01"},
+    # CloudFront can't read objects encrypted with KMS
+    False,
+)
+ENVIRONMENT_OPTIONS = (
+    list(environment.GATEWAY_ENDPOINTS),
+    list(environment.INTERFACE_ENDPOINTS),
+    {"aggregation_interval": 60},
+)
+APPLICATION_OPTIONS = (
+    {"shards": 3, "replicas": 2, "profile": "read-through"},
+    {"engine": "aurora-postgresql", "replicas": 3, "profile": "read-heavy"},
+    {"untagged_days": 3, "keep_images": 10},
+    {"strategy": "partition", "partitions": 3},
+    {"autoscaling_group": "${Environment}-${AppName}", "log_group": "/${Environment}/${AppName}/app",
+     "alarm_actions": ["arn:aws:sns:eu-west-1:123456789012:alarms"]},
+)
+
+
+def measure(create, args):
+    started = time.time()
+    t = create(*args)
+    built = time.time()
+    rendered = t.to_json()
+    serialized = time.time()
+
+    peak = None
+    if tracemalloc:
+        # Tracing slows everything down, so memory is measured on a second run
+        tracemalloc.start()
+        create(*args).to_json()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    return {
+        "build_seconds": built - started,
+        "serialize_seconds": serialized - built,
+        "peak_memory_bytes": peak,
+        "resources": len(t.resources),
+        "template_bytes": len(rendered),
+    }
+
+
+def summarize(name, stacks):
+    times = sorted(stack["build_seconds"] + stack["serialize_seconds"] for stack in stacks)
+    peaks = [stack["peak_memory_bytes"] for stack in stacks if stack["peak_memory_bytes"] is not None]
+    return {
+        "case": name,
+        "stacks": len(stacks),
+        "total_seconds": sum(times),
+        "mean_seconds": sum(times) / len(times),
+        "median_seconds": times[len(times) // 2],
+        "max_seconds": times[-1],
+        "mean_build_seconds": sum(stack["build_seconds"] for stack in stacks) / len(stacks),
+        "mean_serialize_seconds": sum(stack["serialize_seconds"] for stack in stacks) / len(stacks),
+        "max_peak_memory_bytes": max(peaks) if peaks else None,
+        "resources": stacks[0]["resources"],
+        "template_bytes": stacks[0]["template_bytes"],
+    }
+
+
+def plan(count, availability_zones, tiers):
+    table = {"environments": {}}
+    names = ["environment%d" % index for index in range(count)]
+    plans = addressing.plan_environments(table, names, ["10.0.0.0/8"], 16, [], availability_zones, tiers)
+    return [plans[name] for name in names]
+
+
+def environment_cases(count, availability_zones, tiers, options=()):
+    return [(environment.create_template, (addresses, availability_zones, tiers) + options)
+            for addresses in plan(count, availability_zones, tiers)]
+
+
+def nested_cases(availability_zones, tiers, options):
+    # The parent stack of an environment with nested tiers, and the stack of every tier
+    addresses = plan(1, availability_zones, tiers)[0]
+    tier_templates = dict((tier["name"], tier["name"].lower()) for tier in tiers)
+    return [(environment.create_template, (addresses, availability_zones, tiers) + options + (tier_templates,))] + [
+        (environment.create_tier_template, (addresses, availability_zones, tier)) for tier in tiers
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the CloudFormation template generators")
+    parser.add_argument("--environments", type=int, default=200, help="Number of synthetic environment stacks")
+    parser.add_argument("--applications", type=int, default=2000, help="Number of synthetic application stacks")
+    parser.add_argument("--output", default="benchmark.json", help="JSON file where results are written")
+    options = parser.parse_args()
+
+    six_zones = ["eu-west-1a", "eu-west-1b", "eu-west-1c", "eu-west-1d", "eu-west-1e", "eu-west-1f"]
+    cases = [
+        ("base", [(base.create_template, ())]),
+        ("base-all-options", [(base.create_template, BASE_OPTIONS)]),
+        ("environment", environment_cases(1, environment.AVAILABILITY_ZONES, environment.TIERS)),
+        ("environment-6-zones", environment_cases(1, six_zones, environment.TIERS)),
+        ("environment-all-options-6-zones", environment_cases(1, six_zones, environment.TIERS, ENVIRONMENT_OPTIONS)),
+        ("environment-nested-6-zones", nested_cases(six_zones, environment.TIERS, ENVIRONMENT_OPTIONS)),
+        ("application", [(application.create_template, ())]),
+        ("application-all-options", [(application.create_template, APPLICATION_OPTIONS + (six_zones,))]),
+        ("environments-%d" % options.environments,
+         environment_cases(options.environments, environment.AVAILABILITY_ZONES, environment.TIERS)),
+        ("applications-%d" % options.applications, [(application.create_template, ())] * options.applications),
+        ("applications-all-options-%d" % options.applications,
+         [(application.create_template, APPLICATION_OPTIONS + (six_zones,))] * options.applications),
+    ]
+
+    results = []
+    for name, stacks in cases:
+        result = summarize(name, [measure(create, args) for create, args in stacks])
+        results.append(result)
+        print("%-36s %6d stacks %9.3fs total %8.2fms/stack %9s peak" % (
+            name, result["stacks"], result["total_seconds"], result["mean_seconds"] * 1000,
+            result["max_peak_memory_bytes"] if result["max_peak_memory_bytes"] is not None else "-",
+        ))
+
+    with open(options.output, "w") as output:
+        json.dump({
+            "python": platform.python_version(),
+            "troposphere": troposphere.__version__,
+            "results": results,
+        }, output, indent=4, sort_keys=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+import errno
+import hashlib
+import inspect
+import json
+import os
+import sys
+
+import troposphere
+
+import diff
+
+# Rendered templates live in <cache_dir>/templates/<key>.json, where the key is a hash of the
+# generator source, the source of the modules of this directory it imports, its arguments and the
+# troposphere version, so an unchanged generator never has to run twice.
+# The last successful deploy of every stack is recorded in <cache_dir>/stacks/<profile>/<region>/<stack>.json
+# with the template key, the template parameters and the stack outputs, so the role can skip
+# the CloudFormation call when neither the template nor its parameters changed. Stacks of different
+# accounts share names, so the state is kept apart by boto profile.
+
+
+def source_path(module):
+    # __file__ may point to the compiled module
+    return os.path.splitext(os.path.abspath(module.__file__))[0] + ".py"
+
+
+def local_modules(module):
+    # Source of the modules next to module that it uses, directly or through each other, by module name or through
+    # the names it imported from them
+    directory = os.path.dirname(source_path(module))
+    found = set([source_path(module)])
+
+    def visit(current):
+        for value in vars(current).values():
+            used = value if inspect.ismodule(value) else sys.modules.get(getattr(value, "__module__", None) or "")
+            if used is None or not getattr(used, "__file__", None):
+                continue
+            path = source_path(used)
+            if os.path.dirname(path) == directory and path not in found:
+                found.add(path)
+                visit(used)
+
+    visit(module)
+    found.discard(source_path(module))
+    return found
+
+
+def render_key(generator, args):
+    digest = hashlib.sha1()
+    for path in [source_path(generator)] + sorted(local_modules(generator)):
+        with open(path, "rb") as source:
+            digest.update(source.read())
+    digest.update(troposphere.__version__.encode("utf-8"))
+    digest.update(json.dumps(args, sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def content_key(content):
+    # Key of a rendered template, the same for every template that only differs in whitespace or in the order of
+    # its dependencies
+    return hashlib.sha1(json.dumps(diff.canonicalize(json.loads(content)), sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def template_path(cache_dir, key):
+    return os.path.join(cache_dir, "templates", key + ".json")
+
+
+def state_path(cache_dir, profile, region, stack):
+    return os.path.join(cache_dir, "stacks", profile or "default", region, stack + ".json")
+
+
+def load_state(path):
+    try:
+        with open(path) as state:
+            return json.load(state)
+    except (IOError, ValueError):
+        return {}
+
+
+def makedirs(path):
+    try:
+        os.makedirs(path)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+
+
+def write(path, content):
+    # Write to a temporary file first so a concurrent reader never sees half a template
+    makedirs(os.path.dirname(path))
+    tmp = "%s.%d.tmp" % (path, os.getpid())
+    with open(tmp, "wb") as f:
+        f.write(content)
+    os.rename(tmp, path)
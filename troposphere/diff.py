@@ -0,0 +1,72 @@
+import json
+import sys
+
+# Structural diff between two rendered templates, used to detect stacks that don't need to be
+# deployed. Resources are compared property by property, every other section of the template
+# (Parameters, Mappings, Outputs...) entry by entry.
+
+
+def load_template(path):
+    try:
+        with open(path) as template:
+            return canonicalize(json.load(template))
+    except (IOError, ValueError):
+        return {}
+
+
+def canonicalize(template):
+    # "DependsOn": "A" and "DependsOn": ["A"] are the same dependency
+    for resource in template.get("Resources", {}).values():
+        if "DependsOn" in resource:
+            depends_on = resource["DependsOn"]
+            if not isinstance(depends_on, list):
+                depends_on = [depends_on]
+            resource["DependsOn"] = sorted(depends_on)
+    return template
+
+
+def diff_resources(old, new):
+    changes = []
+    for name in sorted(set(old) | set(new)):
+        if name not in old:
+            changes.append("+ %s (%s)" % (name, new[name].get("Type")))
+        elif name not in new:
+            changes.append("- %s (%s)" % (name, old[name].get("Type")))
+        elif old[name] != new[name]:
+            old_properties = dict(old[name].get("Properties", {}), **_attributes(old[name]))
+            new_properties = dict(new[name].get("Properties", {}), **_attributes(new[name]))
+            modified = [
+                key for key in sorted(set(old_properties) | set(new_properties))
+                if old_properties.get(key) != new_properties.get(key)
+            ]
+            changes.append("~ %s (%s): %s" % (name, new[name].get("Type"), ", ".join(modified)))
+    return changes
+
+
+def _attributes(resource):
+    # Resource attributes (Type, DependsOn, DeletionPolicy...) are reported like properties
+    return dict((key, value) for key, value in resource.items() if key != "Properties")
+
+
+def diff_templates(old, new):
+    changes = []
+    for section in sorted(set(old) | set(new)):
+        old_section = old.get(section, {})
+        new_section = new.get(section, {})
+        if section == "Resources":
+            changes.extend(diff_resources(old_section, new_section))
+        elif old_section != new_section:
+            if isinstance(old_section, dict) and isinstance(new_section, dict):
+                modified = [
+                    key for key in sorted(set(old_section) | set(new_section))
+                    if old_section.get(key) != new_section.get(key)
+                ]
+                changes.append("~ %s: %s" % (section, ", ".join(modified)))
+            else:
+                changes.append("~ %s" % section)
+    return changes
+
+
+if __name__ == "__main__":
+    for change in diff_templates(load_template(sys.argv[1]), load_template(sys.argv[2])):
+        print(change)
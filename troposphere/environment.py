@@ -1,336 +1,444 @@
+import json
 import sys
-from troposphere import Join, Output
-from troposphere import Ref, Tags, Template
+from troposphere import GetAZs, Join, Output, Parameter, Select
+from troposphere import ec2
+from troposphere import GetAtt, Ref, Tags, Template
+from troposphere.cloudformation import Stack
 from troposphere.ec2 import InternetGateway
 from troposphere.ec2 import Route
 from troposphere.ec2 import RouteTable
+from troposphere.ec2 import SecurityGroup, SecurityGroupRule
 from troposphere.ec2 import Subnet
 from troposphere.ec2 import SubnetRouteTableAssociation
 from troposphere.ec2 import VPC
+from troposphere.ec2 import VPCEndpoint
 from troposphere.ec2 import VPCGatewayAttachment
 from troposphere.elasticache import SubnetGroup
 from troposphere.rds import DBSubnetGroup
 
-environment_index = int(sys.argv[1])
-
-t = Template()
-
-t.add_version("2010-09-09")
-t.add_description("Stack that creates resources for a specific environment")
-
-ELBRouteTable1 = t.add_resource(RouteTable(
-    "ELBRouteTable1",
-    VpcId=Ref("VPC"),
-    Tags=Tags(
-        Name=Join("-", [Ref("AWS::StackName"), "elb", "eu-west-1a"]),
-    ),
-))
-
-ELBRouteTable2 = t.add_resource(RouteTable(
-    "ELBRouteTable2",
-    VpcId=Ref("VPC"),
-    Tags=Tags(
-        Name=Join("-", [Ref("AWS::StackName"), "elb", "eu-west-1b"]),
-    ),
-))
-
-ELBRouteTable3 = t.add_resource(RouteTable(
-    "ELBRouteTable3",
-    VpcId=Ref("VPC"),
-    Tags=Tags(
-        Name=Join("-", [Ref("AWS::StackName"), "elb", "eu-west-1c"]),
-    ),
-))
-
-ELBRouteTableAssociation1 = t.add_resource(SubnetRouteTableAssociation(
-    "ELBRouteTableAssociation1",
-    SubnetId=Ref("ELBSubnet1"),
-    RouteTableId=Ref("ELBRouteTable1"),
-))
-
-ELBRouteTableAssociation2 = t.add_resource(SubnetRouteTableAssociation(
-    "ELBRouteTableAssociation2",
-    SubnetId=Ref("ELBSubnet2"),
-    RouteTableId=Ref("ELBRouteTable2"),
-))
-
-ELBRouteTableAssociation3 = t.add_resource(SubnetRouteTableAssociation(
-    "ELBRouteTableAssociation3",
-    SubnetId=Ref("ELBSubnet3"),
-    RouteTableId=Ref("ELBRouteTable3"),
-))
-
-ELBSubnet1 = t.add_resource(Subnet(
-    "ELBSubnet1",
-    VpcId=Ref("VPC"),
-    AvailabilityZone="eu-west-1a",
-    CidrBlock="10." + str(environment_index) + ".32.0/20",
-    Tags=Tags(
-        Name=Join("-", [Ref("AWS::StackName"), "elb", "eu-west-1a"]),
-    ),
-))
-
-ELBSubnet2 = t.add_resource(Subnet(
-    "ELBSubnet2",
-    VpcId=Ref("VPC"),
-    AvailabilityZone="eu-west-1b",
-    CidrBlock="10." + str(environment_index) + ".96.0/20",
-    Tags=Tags(
-        Name=Join("-", [Ref("AWS::StackName"), "elb", "eu-west-1b"]),
-    ),
-))
-
-ELBSubnet3 = t.add_resource(Subnet(
-    "ELBSubnet3",
-    VpcId=Ref("VPC"),
-    AvailabilityZone="eu-west-1c",
-    CidrBlock="10." + str(environment_index) + ".160.0/20",
-    Tags=Tags(
-        Name=Join("-", [Ref("AWS::StackName"), "elb", "eu-west-1c"]),
-    ),
-))
-
-ELBRoute1 = t.add_resource(Route(
-    "ELBRoute1",
-    GatewayId=Ref("InternetGateway"),
-    DestinationCidrBlock="0.0.0.0/0",
-    RouteTableId=Ref("ELBRouteTable1"),
-    DependsOn=["InternetGatewayAttachment"],
-))
-
-ELBRoute2 = t.add_resource(Route(
-    "ELBRoute2",
-    GatewayId=Ref("InternetGateway"),
-    DestinationCidrBlock="0.0.0.0/0",
-    RouteTableId=Ref("ELBRouteTable2"),
-    DependsOn=["InternetGatewayAttachment"],
-))
-
-ELBRoute3 = t.add_resource(Route(
-    "ELBRoute3",
-    GatewayId=Ref("InternetGateway"),
-    DestinationCidrBlock="0.0.0.0/0",
-    RouteTableId=Ref("ELBRouteTable3"),
-    DependsOn=["InternetGatewayAttachment"],
-))
-
-AppSubnet1 = t.add_resource(Subnet(
-    "AppSubnet1",
-    VpcId=Ref("VPC"),
-    AvailabilityZone="eu-west-1a",
-    CidrBlock="10." + str(environment_index) + ".0.0/19",
-    Tags=Tags(
-        Name=Join("-", [Ref("AWS::StackName"), "app", "eu-west-1a"]),
-    ),
-))
-
-AppSubnet2 = t.add_resource(Subnet(
-    "AppSubnet2",
-    VpcId=Ref("VPC"),
-    AvailabilityZone="eu-west-1b",
-    CidrBlock="10." + str(environment_index) + ".64.0/19",
-    Tags=Tags(
-        Name=Join("-", [Ref("AWS::StackName"), "app", "eu-west-1b"]),
-    ),
-))
-
-AppSubnet3 = t.add_resource(Subnet(
-    "AppSubnet3",
-    VpcId=Ref("VPC"),
-    AvailabilityZone="eu-west-1c",
-    CidrBlock="10." + str(environment_index) + ".128.0/19",
-    Tags=Tags(
-        Name=Join("-", [Ref("AWS::StackName"), "app", "eu-west-1c"]),
-    ),
-))
-
-AppRouteTableAssociation1 = t.add_resource(SubnetRouteTableAssociation(
-    "AppRouteTableAssociation1",
-    SubnetId=Ref("AppSubnet1"),
-    RouteTableId=Ref("AppRouteTable1"),
-))
-
-AppRouteTableAssociation2 = t.add_resource(SubnetRouteTableAssociation(
-    "AppRouteTableAssociation2",
-    SubnetId=Ref("AppSubnet2"),
-    RouteTableId=Ref("AppRouteTable2"),
-))
-
-AppRouteTableAssociation3 = t.add_resource(SubnetRouteTableAssociation(
-    "AppRouteTableAssociation3",
-    SubnetId=Ref("AppSubnet3"),
-    RouteTableId=Ref("AppRouteTable3"),
-))
-
-AppRouteTable1 = t.add_resource(RouteTable(
-    "AppRouteTable1",
-    VpcId=Ref("VPC"),
-    Tags=Tags(
-        Name=Join("-", [Ref("AWS::StackName"), "app", "eu-west-1a"]),
-    ),
-))
-
-AppRouteTable2 = t.add_resource(RouteTable(
-    "AppRouteTable2",
-    VpcId=Ref("VPC"),
-    Tags=Tags(
-        Name=Join("-", [Ref("AWS::StackName"), "app", "eu-west-1b"]),
-    ),
-))
-
-AppRouteTable3 = t.add_resource(RouteTable(
-    "AppRouteTable3",
-    VpcId=Ref("VPC"),
-    Tags=Tags(
-        Name=Join("-", [Ref("AWS::StackName"), "app", "eu-west-1c"]),
-    ),
-))
-
-AppRoute1 = t.add_resource(Route(
-    "AppRoute1",
-    GatewayId=Ref("InternetGateway"),
-    DestinationCidrBlock="0.0.0.0/0",
-    RouteTableId=Ref("AppRouteTable1"),
-    DependsOn=["InternetGatewayAttachment"],
-))
-
-AppRoute2 = t.add_resource(Route(
-    "AppRoute2",
-    GatewayId=Ref("InternetGateway"),
-    DestinationCidrBlock="0.0.0.0/0",
-    RouteTableId=Ref("AppRouteTable2"),
-    DependsOn=["InternetGatewayAttachment"],
-))
-
-AppRoute3 = t.add_resource(Route(
-    "AppRoute3",
-    GatewayId=Ref("InternetGateway"),
-    DestinationCidrBlock="0.0.0.0/0",
-    RouteTableId=Ref("AppRouteTable3"),
-    DependsOn=["InternetGatewayAttachment"],
-))
-
-DBSubnet1 = t.add_resource(Subnet(
-    "DBSubnet1",
-    VpcId=Ref("VPC"),
-    AvailabilityZone="eu-west-1a",
-    CidrBlock="10." + str(environment_index) + ".48.0/20",
-    Tags=Tags(
-        Name=Join("-", [Ref("AWS::StackName"), "db", "eu-west-1a"]),
-    ),
-))
-
-DBSubnet2 = t.add_resource(Subnet(
-    "DBSubnet2",
-    VpcId=Ref("VPC"),
-    AvailabilityZone="eu-west-1b",
-    CidrBlock="10." + str(environment_index) + ".112.0/20",
-    Tags=Tags(
-        Name=Join("-", [Ref("AWS::StackName"), "db", "eu-west-1b"]),
-    ),
-))
-
-DBSubnet3 = t.add_resource(Subnet(
-    "DBSubnet3",
-    VpcId=Ref("VPC"),
-    AvailabilityZone="eu-west-1c",
-    CidrBlock="10." + str(environment_index) + ".176.0/20",
-    Tags=Tags(
-        Name=Join("-", [Ref("AWS::StackName"), "db", "eu-west-1c"]),
-    ),
-))
-
-DBRouteTable1 = t.add_resource(RouteTable(
-    "DBRouteTable1",
-    VpcId=Ref("VPC"),
-    Tags=Tags(
-        Name=Join("-", [Ref("AWS::StackName"), "db", "eu-west-1a"]),
-    ),
-))
-
-DBRouteTable2 = t.add_resource(RouteTable(
-    "DBRouteTable2",
-    VpcId=Ref("VPC"),
-    Tags=Tags(
-        Name=Join("-", [Ref("AWS::StackName"), "db", "eu-west-1b"]),
-    ),
-))
-
-DBRouteTable3 = t.add_resource(RouteTable(
-    "DBRouteTable3",
-    VpcId=Ref("VPC"),
-    Tags=Tags(
-        Name=Join("-", [Ref("AWS::StackName"), "db", "eu-west-1c"]),
-    ),
-))
-
-DBRouteTableAssociation1 = t.add_resource(SubnetRouteTableAssociation(
-    "DBRouteTableAssociation1",
-    SubnetId=Ref("DBSubnet1"),
-    RouteTableId=Ref("DBRouteTable1"),
-))
-
-DBRouteTableAssociation2 = t.add_resource(SubnetRouteTableAssociation(
-    "DBRouteTableAssociation2",
-    SubnetId=Ref("DBSubnet2"),
-    RouteTableId=Ref("DBRouteTable2"),
-))
-
-DBRouteTableAssociation3 = t.add_resource(SubnetRouteTableAssociation(
-    "DBRouteTableAssociation3",
-    SubnetId=Ref("DBSubnet3"),
-    RouteTableId=Ref("DBRouteTable3"),
-))
-
-ElastiCacheSubnetGroup = t.add_resource(SubnetGroup(
-    "ElastiCacheSubnetGroup",
-    SubnetIds=[Ref("DBSubnet1"), Ref("DBSubnet2"), Ref("DBSubnet3")],
-    Description=Ref("AWS::StackName"),
-))
-
-RDSSubnetGroup = t.add_resource(DBSubnetGroup(
-    "RDSSubnetGroup",
-    SubnetIds=[Ref("DBSubnet1"), Ref("DBSubnet2"), Ref("DBSubnet3")],
-    DBSubnetGroupDescription=Ref("AWS::StackName"),
-))
-
-VPC = t.add_resource(VPC(
-    "VPC",
-    InstanceTenancy="default",
-    EnableDnsSupport=True,
-    CidrBlock="10." + str(environment_index) + ".0.0/16",
-    EnableDnsHostnames=True,
-    Tags=Tags(
-        Name=Ref("AWS::StackName"),
-    ),
-))
-
-InternetGatewayAttachment = t.add_resource(VPCGatewayAttachment(
-    "InternetGatewayAttachment",
-    VpcId=Ref("VPC"),
-    InternetGatewayId=Ref("InternetGateway"),
-))
-
-InternetGateway = t.add_resource(InternetGateway(
-    "InternetGateway",
-    Tags=Tags(
-        Name=Ref("AWS::StackName"),
-    ),
-))
-
-t.add_output(Output("VPC", Value=Ref("VPC"), Description="VPC ID"))
-t.add_output(
-    Output("ELBSubnets", Value=Join(", ", [Ref("ELBSubnet1"), Ref("ELBSubnet2"), Ref("ELBSubnet3")]),
-           Description="ELB Subnets"))
-t.add_output(
-    Output("AppSubnets", Value=Join(", ", [Ref("AppSubnet1"), Ref("AppSubnet2"), Ref("AppSubnet3")]),
-           Description="Application subnets"))
-t.add_output(
-    Output("DBSubnets", Value=Join(", ", [Ref("DBSubnet1"), Ref("DBSubnet2"), Ref("DBSubnet3")]),
-           Description="DB Subnets"))
-t.add_output(
-    Output("InternetGateway", Value=Ref("InternetGateway"),
-           Description="Internet Gateway id"))
-
-
-print(t.to_json())
+import addressing
+
+# Availability zones of every region, zones every account can use. Regions whose zone names differ
+# between accounts have the number of zones instead, and take the first ones Fn::GetAZs returns.
+REGION_AVAILABILITY_ZONES = {
+    "ap-northeast-1": ["ap-northeast-1a", "ap-northeast-1c", "ap-northeast-1d"],
+    "ap-northeast-2": ["ap-northeast-2a", "ap-northeast-2b", "ap-northeast-2c"],
+    "ap-southeast-1": ["ap-southeast-1a", "ap-southeast-1b", "ap-southeast-1c"],
+    "ap-southeast-2": ["ap-southeast-2a", "ap-southeast-2b", "ap-southeast-2c"],
+    "ap-south-1": ["ap-south-1a", "ap-south-1b", "ap-south-1c"],
+    "ca-central-1": ["ca-central-1a", "ca-central-1b", "ca-central-1d"],
+    "eu-west-1": ["eu-west-1a", "eu-west-1b", "eu-west-1c"],
+    "eu-west-2": ["eu-west-2a", "eu-west-2b", "eu-west-2c"],
+    "eu-central-1": ["eu-central-1a", "eu-central-1b", "eu-central-1c"],
+    "sa-east-1": ["sa-east-1a", "sa-east-1b", "sa-east-1c"],
+    "us-west-1": 2,
+    "us-west-2": ["us-west-2a", "us-west-2b", "us-west-2c"],
+    "us-east-1": 3,
+    "us-east-2": ["us-east-2a", "us-east-2b", "us-east-2c"],
+}
+DEFAULT_ZONE_COUNT = 3
+AVAILABILITY_ZONES = REGION_AVAILABILITY_ZONES["eu-west-1"]
+
+# Every tier gets a subnet, a route table and a route table association in every availability zone.
+#  - name: prefix for the logical ids of the tier resources and its output, i.e. ELBSubnet1 and ELBSubnets
+#  - tag: used in the Name tag of the tier resources
+#  - description: description of the output listing the subnets of the tier
+#  - internet: whether the subnets route 0.0.0.0/0 to the internet gateway
+#  - databases: whether the subnets are used by the ElastiCache and RDS subnet groups
+#  - bits: every availability zone gets the same share of the VPC range, and the subnet of the tier
+#    is 1/2^bits of that share. Subnets are allocated in the order of the tiers.
+#  - prefix: optional, fixed prefix length of the subnets of the tier, instead of bits
+#  - gateway_endpoints: optional, whether the route tables of the tier route to the gateway endpoints
+#  - interface_endpoints: optional, whether the interface endpoints are placed in the subnets of the tier.
+#    Only one tier can have them, because an interface endpoint takes a single subnet per zone.
+TIERS = [
+    {"name": "App", "tag": "app", "description": "Application subnets", "internet": True, "databases": False, "bits": 1,
+     "gateway_endpoints": True, "interface_endpoints": True},
+    {"name": "ELB", "tag": "elb", "description": "ELB Subnets", "internet": True, "databases": False, "bits": 2},
+    {"name": "DB", "tag": "db", "description": "DB Subnets", "internet": False, "databases": True, "bits": 2,
+     "gateway_endpoints": True},
+]
+
+# VPC endpoints that can be enabled, by service name, with the prefix of their logical ids.
+# Traffic to these services stays in the AWS network instead of going through the internet gateway.
+GATEWAY_ENDPOINTS = {"s3": "S3", "dynamodb": "DynamoDB"}
+INTERFACE_ENDPOINTS = {
+    "kms": "KMS",
+    "logs": "Logs",
+    "ecr.api": "ECRAPI",
+    "ecr.dkr": "ECRDKR",
+    "cloudformation": "CloudFormation",
+}
+
+
+def region_availability_zones(region):
+    # Zones are names, or indexes in the list of zones of the region for Fn::GetAZs
+    zones = REGION_AVAILABILITY_ZONES.get(region, DEFAULT_ZONE_COUNT)
+    if isinstance(zones, int):
+        return list(range(zones))
+    return zones
+
+
+def zone_name(availability_zone):
+    if isinstance(availability_zone, int):
+        return Select(availability_zone, GetAZs(""))
+    return availability_zone
+
+
+def bucket_arns(bucket):
+    return [Join("", ["arn:aws:s3:::", bucket]), Join("", ["arn:aws:s3:::", bucket, "/*"])]
+
+
+def endpoint_policy(service):
+    # Returns None for services whose endpoint keeps the default policy, allowing everything
+    if service == "s3":
+        buckets = [
+            Ref("StorageBucketName"),
+            Ref("LogBucketName"),
+            # Layers of the ECR images
+            # https://docs.aws.amazon.com/AmazonECR/latest/userguide/vpc-endpoints.html
+            Join("", ["prod-", Ref("AWS::Region"), "-starport-layer-bucket"]),
+            # Amazon Linux package repositories
+            Join("", ["packages.", Ref("AWS::Region"), ".amazonaws.com"]),
+            Join("", ["repo.", Ref("AWS::Region"), ".amazonaws.com"]),
+            Join("", ["amazonlinux.", Ref("AWS::Region"), ".amazonaws.com"]),
+        ]
+        return {
+            "Version": "2012-10-17",
+            "Statement": [{
+                "Sid": "WimpyBuckets",
+                "Effect": "Allow",
+                "Principal": "*",
+                "Action": "s3:*",
+                "Resource": [arn for bucket in buckets for arn in bucket_arns(bucket)],
+            }]
+        }
+    if service == "kms":
+        return {
+            "Version": "2012-10-17",
+            "Statement": [{
+                "Sid": "WimpyMasterKey",
+                "Effect": "Allow",
+                "Principal": "*",
+                "Action": "kms:*",
+                "Resource": Join("", ["arn:aws:kms:", Ref("AWS::Region"), ":", Ref("AWS::AccountId"), ":key/", Ref("MasterKey")]),
+            }]
+        }
+    return None
+
+
+def add_base_parameters(t):
+    # The buckets and the key of the base stack, so endpoint policies are scoped to them and flow logs reach them
+    t.add_parameter(Parameter("StorageBucketName", Type="String", Description="Bucket for applications to store data"))
+    t.add_parameter(Parameter("LogBucketName", Type="String", Description="Bucket for logs"))
+    t.add_parameter(Parameter("MasterKey", Type="String", Description="KMS Key of the account"))
+
+
+def add_endpoints(t, addresses, availability_zones, tiers, gateway_endpoints, interface_endpoints, ref=Ref):
+    # ref returns the id of a subnet or route table of a tier from its logical id, see tier_ref
+    route_tables = [
+        ref("%sRouteTable%d" % (tier["name"], index + 1))
+        for tier in tiers if tier.get("gateway_endpoints")
+        for index in range(len(availability_zones))
+    ]
+    for service in gateway_endpoints:
+        properties = {
+            "VpcId": Ref("VPC"),
+            "ServiceName": Join(".", ["com.amazonaws", Ref("AWS::Region"), service]),
+            "VpcEndpointType": "Gateway",
+            "RouteTableIds": route_tables,
+        }
+        if endpoint_policy(service):
+            properties["PolicyDocument"] = endpoint_policy(service)
+        t.add_resource(VPCEndpoint("%sEndpoint" % GATEWAY_ENDPOINTS[service], **properties))
+
+    if not interface_endpoints:
+        return
+
+    interface_tiers = [tier for tier in tiers if tier.get("interface_endpoints")]
+    if len(interface_tiers) != 1:
+        raise ValueError("Interface endpoints need exactly one tier with interface_endpoints, got %d" % len(interface_tiers))
+
+    t.add_resource(SecurityGroup(
+        "EndpointSecurityGroup",
+        GroupDescription="Allows HTTPS from the VPC to the interface endpoints",
+        VpcId=Ref("VPC"),
+        SecurityGroupIngress=[SecurityGroupRule(
+            IpProtocol="tcp",
+            FromPort="443",
+            ToPort="443",
+            CidrIp=addresses["VPC"],
+        )],
+        Tags=Tags(
+            Name=Join("-", [Ref("AWS::StackName"), "endpoints"]),
+        ),
+    ))
+
+    for service in interface_endpoints:
+        properties = {
+            "VpcId": Ref("VPC"),
+            "ServiceName": Join(".", ["com.amazonaws", Ref("AWS::Region"), service]),
+            "VpcEndpointType": "Interface",
+            "SubnetIds": [ref("%sSubnet%d" % (interface_tiers[0]["name"], index + 1)) for index in range(len(availability_zones))],
+            "SecurityGroupIds": [Ref("EndpointSecurityGroup")],
+            # Instances keep using the public name of the service, which resolves to the endpoint
+            "PrivateDnsEnabled": True,
+        }
+        if endpoint_policy(service):
+            properties["PolicyDocument"] = endpoint_policy(service)
+        t.add_resource(VPCEndpoint("%sEndpoint" % INTERFACE_ENDPOINTS[service], **properties))
+
+
+# Options of the flow logs of the VPC, delivered to LogBucket under VPCFlowLogs/ in Parquet
+#  - traffic_type: ACCEPT, REJECT or ALL. By default ALL
+#  - aggregation_interval: seconds flows are aggregated for, 60 or 600. By default 600
+#  - fields: optional, list of fields of every flow, i.e. az-id or flow-direction. By default the default format
+#  - hive_partitions: whether the keys of the objects use Hive-compatible partitions. By default false
+FLOW_LOGS_DEFAULTS = {
+    "traffic_type": "ALL",
+    "aggregation_interval": 600,
+    "fields": None,
+    "hive_partitions": False,
+}
+FLOW_LOGS_PREFIX = "VPCFlowLogs/"
+
+
+class FlowLog(ec2.FlowLog):
+    # troposphere 2.7.1 doesn't know the file format and partitions of flow logs delivered to S3
+    props = dict(ec2.FlowLog.props, DestinationOptions=(dict, False))
+
+
+def add_flow_logs(t, flow_logs):
+    options = dict(FLOW_LOGS_DEFAULTS, **flow_logs)
+    unknown = set(options) - set(FLOW_LOGS_DEFAULTS)
+    if unknown:
+        raise ValueError("Unknown flow logs options %s" % ", ".join(sorted(unknown)))
+
+    properties = {
+        "ResourceId": Ref("VPC"),
+        "ResourceType": "VPC",
+        "TrafficType": options["traffic_type"],
+        "LogDestinationType": "s3",
+        "LogDestination": Join("", ["arn:aws:s3:::", Ref("LogBucketName"), "/", FLOW_LOGS_PREFIX]),
+        "MaxAggregationInterval": int(options["aggregation_interval"]),
+        # Columnar files partitioned by hour, so queries only read the columns and the hours they need
+        "DestinationOptions": {
+            "FileFormat": "parquet",
+            "HiveCompatiblePartitions": bool(options["hive_partitions"]),
+            "PerHourPartition": True,
+        },
+        "Tags": Tags(
+            Name=Ref("AWS::StackName"),
+        ),
+    }
+    if options["fields"]:
+        properties["LogFormat"] = " ".join("${%s}" % field for field in options["fields"])
+    t.add_resource(FlowLog("FlowLog", **properties))
+
+    t.add_output(Output("FlowLog", Value=Ref("FlowLog"), Description="Flow logs of the VPC"))
+
+
+def add_tier(t, addresses, availability_zones, tier, stack_name):
+    # Subnets and route tables of a tier. VPC is a resource of the environment stack, or a parameter of a tier stack.
+    for index, availability_zone in enumerate(availability_zones):
+        number = index + 1
+
+        t.add_resource(Subnet(
+            "%sSubnet%d" % (tier["name"], number),
+            VpcId=Ref("VPC"),
+            AvailabilityZone=zone_name(availability_zone),
+            CidrBlock=addresses["%sSubnet%d" % (tier["name"], number)],
+            Tags=Tags(
+                Name=Join("-", [stack_name, tier["tag"], zone_name(availability_zone)]),
+            ),
+        ))
+
+        t.add_resource(RouteTable(
+            "%sRouteTable%d" % (tier["name"], number),
+            VpcId=Ref("VPC"),
+            Tags=Tags(
+                Name=Join("-", [stack_name, tier["tag"], zone_name(availability_zone)]),
+            ),
+        ))
+
+        t.add_resource(SubnetRouteTableAssociation(
+            "%sRouteTableAssociation%d" % (tier["name"], number),
+            SubnetId=Ref("%sSubnet%d" % (tier["name"], number)),
+            RouteTableId=Ref("%sRouteTable%d" % (tier["name"], number)),
+        ))
+
+
+def add_routes(t, availability_zones, tier, ref=Ref):
+    # Routes of a tier to the internet gateway. They stay in the environment stack even when the tier is nested, so
+    # only they wait for the attachment of the gateway and the rest of the tier is created at the same time.
+    for index in range(len(availability_zones)):
+        number = index + 1
+        t.add_resource(Route(
+            "%sRoute%d" % (tier["name"], number),
+            DependsOn=["InternetGatewayAttachment"],
+            GatewayId=Ref("InternetGateway"),
+            DestinationCidrBlock="0.0.0.0/0",
+            RouteTableId=ref("%sRouteTable%d" % (tier["name"], number)),
+        ))
+
+
+def tier_resources(tier, availability_zones):
+    # Logical ids of the subnets and route tables of a tier, the outputs of its nested stack
+    return ["%s%s%d" % (tier["name"], kind, index + 1) for kind in ("Subnet", "RouteTable") for index in range(len(availability_zones))]
+
+
+def create_tier_template(addresses, availability_zones, tier):
+    # Template of the nested stack of a tier, outputs the subnets and route tables of the tier by logical id
+    t = Template()
+
+    t.add_version("2010-09-09")
+    t.add_description("Stack that creates the %s tier of an environment" % tier["name"])
+
+    t.add_parameter(Parameter("EnvironmentName", Type="String", Description="Name of the environment stack"))
+    t.add_parameter(Parameter("VPC", Type="String", Description="VPC ID"))
+
+    add_tier(t, addresses, availability_zones, tier, Ref("EnvironmentName"))
+
+    for name in tier_resources(tier, availability_zones):
+        t.add_output(Output(name, Value=Ref(name)))
+
+    return t
+
+
+def tier_ref(tiers, availability_zones, nested):
+    # Resources of nested tiers are outputs of their stack, named like the resource, i.e. DBTier.Outputs.DBSubnet1
+    if not nested:
+        return Ref
+    stacks = dict((name, "%sTier" % tier["name"]) for tier in tiers for name in tier_resources(tier, availability_zones))
+    return lambda name: GetAtt(stacks[name], "Outputs.%s" % name)
+
+
+def add_tier_stacks(t, tiers, tier_templates):
+    # Every tier is a nested stack, so tiers are created and updated in parallel and a change in one tier only
+    # updates its own stack
+    t.add_parameter(Parameter(
+        "TemplatesURL",
+        Type="String",
+        Description="URL of the prefix where the templates of the tiers are staged",
+    ))
+    for tier in tiers:
+        t.add_resource(Stack(
+            "%sTier" % tier["name"],
+            TemplateURL=Join("", [Ref("TemplatesURL"), tier_templates[tier["name"]], ".json"]),
+            Parameters={"EnvironmentName": Ref("AWS::StackName"), "VPC": Ref("VPC")},
+            Tags=Tags(
+                Name=Join("-", [Ref("AWS::StackName"), tier["tag"]]),
+            ),
+        ))
+
+
+def create_template(addresses, availability_zones=None, tiers=None, gateway_endpoints=None, interface_endpoints=None,
+                    flow_logs=None, tier_templates=None):
+    # addresses maps the logical id of the VPC and every subnet to its CIDR block, see addressing.py
+    # gateway_endpoints and interface_endpoints are lists of service names, see GATEWAY_ENDPOINTS and INTERFACE_ENDPOINTS
+    # flow_logs is an optional dictionary with the options of the flow logs of the VPC, see FLOW_LOGS_DEFAULTS,
+    # or true for the defaults
+    # tier_templates optionally maps the name of every tier to the key of its template, see create_tier_template, and
+    # makes every tier a nested stack created from the TemplatesURL parameter
+    availability_zones = availability_zones or AVAILABILITY_ZONES
+    tiers = tiers or TIERS
+    gateway_endpoints = gateway_endpoints or []
+    interface_endpoints = interface_endpoints or []
+    for service in gateway_endpoints:
+        if service not in GATEWAY_ENDPOINTS:
+            raise ValueError("Unknown gateway endpoint %s, choose from %s" % (service, ", ".join(sorted(GATEWAY_ENDPOINTS))))
+    for service in interface_endpoints:
+        if service not in INTERFACE_ENDPOINTS:
+            raise ValueError("Unknown interface endpoint %s, choose from %s" % (service, ", ".join(sorted(INTERFACE_ENDPOINTS))))
+
+    t = Template()
+
+    t.add_version("2010-09-09")
+    t.add_description("Stack that creates resources for a specific environment")
+
+    if tier_templates:
+        add_tier_stacks(t, tiers, tier_templates)
+    else:
+        for tier in tiers:
+            add_tier(t, addresses, availability_zones, tier, Ref("AWS::StackName"))
+    ref = tier_ref(tiers, availability_zones, tier_templates)
+    for tier in tiers:
+        if tier["internet"]:
+            add_routes(t, availability_zones, tier, ref)
+
+    database_subnets = [
+        ref("%sSubnet%d" % (tier["name"], index + 1))
+        for tier in tiers if tier["databases"]
+        for index in range(len(availability_zones))
+    ]
+    if database_subnets:
+        t.add_resource(SubnetGroup(
+            "ElastiCacheSubnetGroup",
+            SubnetIds=database_subnets,
+            Description=Ref("AWS::StackName"),
+        ))
+
+        t.add_resource(DBSubnetGroup(
+            "RDSSubnetGroup",
+            SubnetIds=database_subnets,
+            DBSubnetGroupDescription=Ref("AWS::StackName"),
+        ))
+
+    t.add_resource(VPC(
+        "VPC",
+        InstanceTenancy="default",
+        EnableDnsSupport=True,
+        CidrBlock=addresses["VPC"],
+        EnableDnsHostnames=True,
+        Tags=Tags(
+            Name=Ref("AWS::StackName"),
+        ),
+    ))
+
+    t.add_resource(VPCGatewayAttachment(
+        "InternetGatewayAttachment",
+        VpcId=Ref("VPC"),
+        InternetGatewayId=Ref("InternetGateway"),
+    ))
+
+    t.add_resource(InternetGateway(
+        "InternetGateway",
+        Tags=Tags(
+            Name=Ref("AWS::StackName"),
+        ),
+    ))
+
+    if gateway_endpoints or interface_endpoints or flow_logs:
+        add_base_parameters(t)
+    if gateway_endpoints or interface_endpoints:
+        add_endpoints(t, addresses, availability_zones, tiers, gateway_endpoints, interface_endpoints, ref)
+    if flow_logs:
+        add_flow_logs(t, flow_logs if isinstance(flow_logs, dict) else {})
+
+    t.add_output(Output("VPC", Value=Ref("VPC"), Description="VPC ID"))
+    for tier in tiers:
+        t.add_output(
+            Output("%sSubnets" % tier["name"],
+                   Value=Join(", ", [ref("%sSubnet%d" % (tier["name"], index + 1)) for index in range(len(availability_zones))]),
+                   Description=tier["description"]))
+    t.add_output(
+        Output("InternetGateway", Value=Ref("InternetGateway"),
+               Description="Internet Gateway id"))
+    if database_subnets:
+        t.add_output(
+            Output("ElastiCacheSubnetGroup", Value=Ref("ElastiCacheSubnetGroup"),
+                   Description="ElastiCache subnet group of the database subnets"))
+        t.add_output(
+            Output("RDSSubnetGroup", Value=Ref("RDSSubnetGroup"),
+                   Description="RDS subnet group of the database subnets"))
+
+    return t
+
+
+if __name__ == "__main__":
+    # environment.py INDEX [AVAILABILITY_ZONES_JSON [TIERS_JSON [REGION]]] renders the VPC 10.INDEX.0.0/16
+    availability_zones, tiers = (json.loads(arg) for arg in (sys.argv[2:4] + ["null", "null"])[:2])
+    availability_zones = availability_zones or region_availability_zones((sys.argv[4:] + ["eu-west-1"])[0])
+    tiers = tiers or TIERS
+    addresses = addressing.plan_environment({}, "10.%d.0.0/16" % int(sys.argv[1]), availability_zones, tiers)
+    print(create_template(addresses, availability_zones, tiers).to_json())
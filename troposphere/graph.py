@@ -0,0 +1,163 @@
+import argparse
+import json
+import re
+
+import diff
+
+# Dependency graph of the resources of a rendered template. CloudFormation creates a resource once
+# every resource it depends on, through DependsOn, Ref, Fn::GetAtt or Fn::Sub, has been created, so
+# the longest chain of dependencies bounds how fast a stack can be created no matter how many
+# resources it has. Explicit dependencies already implied by another chain of dependencies don't
+# change the order resources are created in, and can be removed from the template.
+
+SUB_REFERENCE = re.compile(r"\$\{([A-Za-z0-9]+)(?:\.[^}]*)?\}")
+
+
+def references(value):
+    # Logical ids referenced by Ref, Fn::GetAtt and Fn::Sub anywhere in value
+    found = set()
+    if isinstance(value, dict):
+        for key, item in value.items():
+            if key == "Ref" and not isinstance(item, (dict, list)):
+                found.add(item)
+            elif key == "Fn::GetAtt":
+                found.add(item[0] if isinstance(item, list) else item.split(".")[0])
+            elif key == "Fn::Sub":
+                found.update(SUB_REFERENCE.findall(item if not isinstance(item, list) else item[0]))
+                if isinstance(item, list):
+                    found.update(references(item[1]))
+            else:
+                found.update(references(item))
+    elif isinstance(value, list):
+        for item in value:
+            found.update(references(item))
+    return found
+
+
+def dependencies(template):
+    # Maps every resource to its explicit and implicit dependencies on other resources
+    resources = template.get("Resources", {})
+    graph = {}
+    for name, resource in resources.items():
+        depends_on = resource.get("DependsOn", [])
+        if not isinstance(depends_on, list):
+            depends_on = [depends_on]
+        implicit = references(dict((key, value) for key, value in resource.items() if key != "DependsOn"))
+        graph[name] = {
+            "explicit": set(depends_on) & set(resources),
+            "implicit": (implicit & set(resources)) - set([name]),
+        }
+    return graph
+
+
+def edges(graph, name, skip=None):
+    return (graph[name]["explicit"] | graph[name]["implicit"]) - set([skip] if skip else [])
+
+
+def depths(graph):
+    # Number of resources of the longest chain ending in every resource, itself included
+    result = {}
+    visiting = set()
+
+    def depth(name):
+        if name in result:
+            return result[name]
+        if name in visiting:
+            raise ValueError("Circular dependency through %s" % name)
+        visiting.add(name)
+        result[name] = 1 + max([depth(dependency) for dependency in edges(graph, name)] or [0])
+        visiting.discard(name)
+        return result[name]
+
+    for name in sorted(graph):
+        depth(name)
+    return result
+
+
+def critical_path(graph):
+    if not graph:
+        return []
+    resource_depths = depths(graph)
+    name = max(sorted(graph), key=lambda resource: resource_depths[resource])
+    path = [name]
+    while edges(graph, name):
+        name = max(sorted(edges(graph, name)), key=lambda resource: resource_depths[resource])
+        path.append(name)
+    return list(reversed(path))
+
+
+def reachable(graph, start, target, skip):
+    # Whether target is a dependency of start through any chain that doesn't use the edge start -> skip
+    pending = list(edges(graph, start, skip))
+    seen = set(pending)
+    while pending:
+        name = pending.pop()
+        if name == target:
+            return True
+        for dependency in edges(graph, name) - seen:
+            seen.add(dependency)
+            pending.append(dependency)
+    return False
+
+
+def redundant_dependencies(graph):
+    # Explicit dependencies that are also references, or that another chain of dependencies already implies
+    return sorted(
+        (name, dependency)
+        for name in graph
+        for dependency in graph[name]["explicit"]
+        if dependency in graph[name]["implicit"] or reachable(graph, name, dependency, dependency)
+    )
+
+
+def serializing_dependencies(graph):
+    # Explicit dependencies on the critical path, with the length of the critical path without them.
+    # Whether they can go depends on what the resources do, so they are only reported.
+    path = critical_path(graph)
+    length = len(path)
+    found = []
+    for dependency, name in zip(path, path[1:]):
+        if dependency in graph[name]["explicit"] and dependency not in graph[name]["implicit"]:
+            graph[name]["explicit"].discard(dependency)
+            found.append((name, dependency, len(critical_path(graph))))
+            graph[name]["explicit"].add(dependency)
+    return [(name, dependency, shorter) for name, dependency, shorter in found if shorter < length]
+
+
+def remove_dependencies(template, removed):
+    for name, dependency in removed:
+        resource = template["Resources"][name]
+        depends_on = [item for item in resource["DependsOn"] if item != dependency]
+        if depends_on:
+            resource["DependsOn"] = depends_on
+        else:
+            del resource["DependsOn"]
+    return template
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report the critical path and the redundant dependencies of a template")
+    parser.add_argument("template", help="Rendered template")
+    parser.add_argument("--apply", metavar="OUTPUT", help="Write the template without its redundant dependencies to OUTPUT")
+    options = parser.parse_args()
+
+    template = diff.load_template(options.template)
+    graph = dependencies(template)
+    path = critical_path(graph)
+    print("%d resources, critical path of %d: %s" % (len(graph), len(path), " -> ".join(path)))
+
+    redundant = redundant_dependencies(graph)
+    for name, dependency in redundant:
+        print("- %s DependsOn %s: redundant" % (name, dependency))
+    for name, dependency in redundant:
+        graph[name]["explicit"].discard(dependency)
+    for name, dependency, shorter in serializing_dependencies(graph):
+        print("? %s DependsOn %s: critical path of %d without it" % (name, dependency, shorter))
+
+    if options.apply:
+        with open(options.apply, "w") as output:
+            json.dump(remove_dependencies(template, redundant), output, indent=4, sort_keys=True)
+
+
+if __name__ == "__main__":
+    main()
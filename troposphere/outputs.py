@@ -0,0 +1,48 @@
+import json
+import os
+import time
+
+import cache
+
+# Stack outputs recorded by the last deploy of every stack are reused while they are younger
+# than a TTL. Older ones are described again, which is a single API call per stack instead of
+# a whole stack update, and stacks that don't exist anymore lose their recorded state so they
+# are deployed again. The age of the outputs is the refreshed_at timestamp of the recorded state,
+# the file itself isn't rewritten when its content doesn't change.
+
+
+def is_stale(deployed, ttl):
+    # deployed is the recorded state of a stack, states recorded without a timestamp are stale
+    if ttl is None or not deployed:
+        return False
+    return time.time() - deployed.get("refreshed_at", 0) > ttl
+
+
+def describe_outputs(client, stack):
+    # Returns None if the stack doesn't exist
+    from botocore.exceptions import ClientError
+
+    try:
+        stacks = client.describe_stacks(StackName=stack)["Stacks"]
+    except ClientError as e:
+        if "does not exist" in str(e):
+            return None
+        raise
+    return dict((output["OutputKey"], output["OutputValue"]) for output in stacks[0].get("Outputs", []))
+
+
+def refresh(stacks, region, profile=None):
+    # stacks maps stack names to the rendered stacks of render.py, whose recorded state is refreshed.
+    # boto3 is only needed when there is something to refresh.
+    import boto3
+    client = boto3.session.Session(profile_name=profile, region_name=region).client("cloudformation")
+
+    for name, stack in stacks.items():
+        stack_outputs = describe_outputs(client, name)
+        if stack_outputs is None:
+            os.remove(stack["state"])
+            stack["deployed"] = {}
+        else:
+            stack["deployed"]["stack_outputs"] = stack_outputs
+            stack["deployed"]["refreshed_at"] = int(time.time())
+            cache.write(stack["state"], json.dumps(stack["deployed"]).encode("utf-8"))
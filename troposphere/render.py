@@ -0,0 +1,189 @@
+import argparse
+import json
+import os
+import time
+
+import addressing
+import application
+import base
+import cache
+import diff
+import environment
+import graph
+import outputs
+import report
+
+# Renders every template the role needs in a single interpreter, so troposphere is imported once
+# instead of once per stack. Prints, for every stack, the rendered template, its render key, its
+# size and whether it is too big to be sent inline to CloudFormation, the path of its state file,
+# the state recorded by its last successful deploy and the changes between the last deployed
+# template and the rendered one. Recorded outputs of unchanged stacks older than --outputs-ttl
+# seconds are described again.
+
+
+def serialize(t, compact):
+    # Keys are always sorted, so the same template is always serialized to the same bytes
+    if compact:
+        return t.to_json(indent=None, separators=(",", ":"))
+    return t.to_json()
+
+
+def render_template(options, generator, args):
+    key = cache.render_key(generator, [list(args), options.compact])
+    path = cache.template_path(options.cache_dir, key)
+    cached = os.path.exists(path)
+    if not cached:
+        cache.write(path, serialize(generator.create_template(*args), options.compact).encode("utf-8"))
+    return key, path, cached
+
+
+def render_tier(options, addresses, availability_zones, tier):
+    # Templates of the nested stacks of the tiers are keyed by their content instead of the generator source, so
+    # a change in environment.py only stages again, and updates, the tiers whose template changes
+    content = serialize(environment.create_tier_template(addresses, availability_zones, tier), options.compact)
+    key = cache.content_key(content)
+    path = cache.template_path(options.cache_dir, key)
+    cached = os.path.exists(path)
+    if not cached:
+        cache.write(path, content.encode("utf-8"))
+    return {"key": key, "template": path, "cached": cached}
+
+
+def render_tiers(options, addresses, availability_zones, tiers):
+    # Templates of the nested stacks of the tiers of an environment, always staged in S3
+    return dict((tier["name"], render_tier(options, addresses, availability_zones, tier)) for tier in tiers)
+
+
+def render_stack(options, stack, generator, *args):
+    started = time.time()
+    key, path, cached = render_template(options, generator, args)
+    render_seconds = time.time() - started
+    size = os.path.getsize(path)
+    template = diff.load_template(path)
+
+    state = cache.state_path(options.cache_dir, options.profile, options.region, stack)
+    cache.makedirs(os.path.dirname(state))
+
+    rendered = {
+        "key": key,
+        "template": path,
+        "bytes": size,
+        "staged": size > options.inline_limit,
+        "cached": cached,
+        "render_seconds": render_seconds,
+        "resources": len(template.get("Resources", {})),
+        "critical_path": len(graph.critical_path(graph.dependencies(template))),
+        "state": state,
+        "deployed": cache.load_state(state),
+    }
+    rendered["changes"] = changes(options, rendered, template)
+    return rendered
+
+
+def render_environment(options, name, addresses, availability_zones, tiers):
+    tier_templates = render_tiers(options, addresses, availability_zones, tiers) if options.nested_tiers else {}
+    rendered = render_stack(
+        options, name, environment, addresses, availability_zones, tiers,
+        options.gateway_endpoints, options.interface_endpoints, options.flow_logs,
+        dict((tier, template["key"]) for tier, template in tier_templates.items()) or None
+    )
+    rendered["tiers"] = tier_templates
+    return rendered
+
+
+def application_stack(app):
+    return "%s-%s-resources" % (app["environment"], app["name"])
+
+
+def changes(options, rendered, template):
+    deployed_template = {}
+    if "key" in rendered["deployed"]:
+        deployed_template = diff.load_template(cache.template_path(options.cache_dir, rendered["deployed"]["key"]))
+    return diff.diff_templates(deployed_template, template)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render the CloudFormation templates through the render cache")
+    parser.add_argument("--cache-dir", required=True, help="Directory where templates and stack states are kept")
+    parser.add_argument("--region", required=True, help="AWS region where the stacks are deployed")
+    parser.add_argument("--storage-distribution", type=json.loads,
+                        help="JSON object with the options of the CloudFront distribution of the storage bucket")
+    parser.add_argument("--log-bucket-lifecycle", type=json.loads, help="JSON list of lifecycle rules of the log bucket")
+    parser.add_argument("--storage-bucket-lifecycle", type=json.loads, help="JSON list of lifecycle rules of the storage bucket")
+    parser.add_argument("--storage-acceleration", action="store_true", help="Enable Transfer Acceleration on the storage bucket")
+    parser.add_argument("--storage-encryption", action="store_true",
+                        help="Encrypt new objects of the storage bucket with the master key and a bucket key")
+    parser.add_argument("--ecr-replication-regions", type=json.loads,
+                        help="JSON list of regions the ECR repositories are replicated to")
+    parser.add_argument("--log-analytics", type=json.loads,
+                        help="JSON object with the options of the Glue tables and the Athena workgroup over the logs")
+    parser.add_argument("--environments", required=True, type=json.loads, help="JSON list of environments")
+    parser.add_argument("--availability-zones", type=json.loads, help="JSON list of availability zones for the environments, by default the zones of the region")
+    parser.add_argument("--tiers", type=json.loads, help="JSON list of subnet tiers for the environments")
+    parser.add_argument("--address-table", required=True, help="File where the allocated VPC and subnet ranges are kept")
+    parser.add_argument("--supernets", type=json.loads, default=["10.0.0.0/8"], help="JSON list of ranges for the VPCs")
+    parser.add_argument("--vpc-prefix", type=int, default=16, help="Prefix length of the VPC ranges")
+    parser.add_argument("--reserved", type=json.loads, default=[], help="JSON list of ranges the VPCs must not overlap")
+    parser.add_argument("--gateway-endpoints", type=json.loads, default=[],
+                        help="JSON list of services with a gateway endpoint in every environment")
+    parser.add_argument("--interface-endpoints", type=json.loads, default=[],
+                        help="JSON list of services with an interface endpoint in every environment")
+    parser.add_argument("--nested-tiers", action="store_true",
+                        help="Create the subnets of every tier of the environments in a nested stack")
+    parser.add_argument("--flow-logs", type=json.loads, help="JSON object with the options of the flow logs of every environment")
+    parser.add_argument("--applications", required=True, type=json.loads,
+                        help="JSON list of applications, with the name, the environment and the options of every application")
+    parser.add_argument("--compact", action="store_true", help="Render templates without whitespace")
+    parser.add_argument("--inline-limit", type=int, default=51200,
+                        help="Templates bigger than this many bytes have to be staged in S3")
+    parser.add_argument("--outputs-ttl", type=int, help="Seconds recorded stack outputs are used without describing the stack")
+    parser.add_argument("--profile", help="Boto profile used to describe stacks, the state of deployed stacks is kept by profile")
+    parser.add_argument("--report", help="JSON file where render timings, resource counts and sizes are written")
+    options = parser.parse_args()
+    started = time.time()
+
+    availability_zones = options.availability_zones or environment.region_availability_zones(options.region)
+    tiers = options.tiers or environment.TIERS
+    table = addressing.load_table(options.address_table)
+    addresses = addressing.plan_environments(
+        table, options.environments, options.supernets, options.vpc_prefix, options.reserved, availability_zones, tiers
+    )
+    addressing.save_table(options.address_table, table)
+
+    rendered = {
+        "base": render_stack(
+            options, "base", base,
+            options.storage_distribution, options.log_bucket_lifecycle, options.storage_bucket_lifecycle, options.storage_acceleration,
+            options.ecr_replication_regions, options.flow_logs, options.log_analytics, options.storage_encryption
+        ),
+        "environments": dict(
+            (name, render_environment(options, name, addresses[name], availability_zones, tiers))
+            for name in options.environments
+        ),
+        "applications": dict(
+            (application_stack(app), render_stack(
+                options, application_stack(app), application, app.get("cache"), app.get("database"), app.get("repository"), app.get("placement"), app.get("monitoring"),
+                availability_zones
+            ))
+            for app in options.applications
+        ),
+    }
+
+    stacks = dict(rendered["environments"], base=rendered["base"], **rendered["applications"])
+    stale = dict(
+        (name, stack) for name, stack in stacks.items()
+        if not stack["changes"] and outputs.is_stale(stack["deployed"], options.outputs_ttl)
+    )
+    if stale:
+        outputs.refresh(stale, options.region, options.profile)
+        for stack in stale.values():
+            stack["changes"] = changes(options, stack, diff.load_template(stack["template"]))
+
+    if options.report:
+        report.write_render_report(options.report, rendered, time.time() - started)
+
+    print(json.dumps(rendered))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+import argparse
+import csv
+import json
+import os
+import sys
+
+import cache
+
+# Report of a role run, one per wimpy_deploy_id. render.py writes how long every template took to
+# render, how many resources it has, the length of its critical path and its size. At the end of
+# the run the role adds how long every stack spent uploading its template, submitting it to
+# CloudFormation and waiting for the stack, and the report is written both as JSON and as CSV.
+
+PHASES = ["render", "upload", "submit", "wait"]
+COLUMNS = ["stack", "type", "deployed", "cached", "resources", "critical_path", "bytes"] + ["%s_seconds" % phase for phase in PHASES] + ["total_seconds"]
+
+
+def write_render_report(path, rendered, seconds):
+    groups = [
+        ("base", {"base": rendered["base"]}),
+        ("environment", rendered["environments"]),
+        ("application", rendered["applications"]),
+    ]
+    stacks = {}
+    for stack_type, group in groups:
+        for name, stack in group.items():
+            stacks[name] = {
+                "type": stack_type,
+                "cached": stack["cached"],
+                "resources": stack["resources"],
+                "critical_path": stack["critical_path"],
+                "bytes": stack["bytes"],
+                "render_seconds": stack["render_seconds"],
+            }
+    cache.write(path, json.dumps({"render_seconds": seconds, "stacks": stacks}, indent=4, sort_keys=True).encode("utf-8"))
+
+
+def add_phases(report, phases):
+    for name, stack in report["stacks"].items():
+        stack.update(phases.get(name, {"deployed": False}))
+        for phase in PHASES:
+            stack.setdefault("%s_seconds" % phase, 0)
+        stack["total_seconds"] = sum(stack["%s_seconds" % phase] for phase in PHASES)
+    return report
+
+
+def write_csv(path, report):
+    if sys.version_info[0] < 3:
+        output = open(path, "wb")
+    else:
+        output = open(path, "w", newline="")
+    with output:
+        writer = csv.writer(output)
+        writer.writerow(COLUMNS)
+        for name, stack in sorted(report["stacks"].items()):
+            writer.writerow([name] + [stack.get(column) for column in COLUMNS[1:]])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Add the deploy phases to the report written by render.py")
+    parser.add_argument("--report", required=True, help="JSON report written by render.py")
+    parser.add_argument("--deploy-id", required=True, help="Identifier of the role run")
+    parser.add_argument("--phases", required=True, type=json.loads,
+                        help="JSON object with the seconds every stack spent in every phase")
+    options = parser.parse_args()
+
+    report = cache.load_state(options.report)
+    report.setdefault("stacks", {})
+    add_phases(report, options.phases)
+    report["deploy_id"] = options.deploy_id
+    cache.write(options.report, json.dumps(report, indent=4, sort_keys=True).encode("utf-8"))
+    write_csv(os.path.splitext(options.report)[0] + ".csv", report)
+
+    slowest = sorted(report["stacks"].items(), key=lambda item: item[1]["total_seconds"], reverse=True)
+    for name, stack in slowest[:5]:
+        print("%s: %.1fs (%s)" % (name, stack["total_seconds"], ", ".join(
+            "%s %.1fs" % (phase, stack["%s_seconds" % phase]) for phase in PHASES
+        )))
+
+
+if __name__ == "__main__":
+    main()